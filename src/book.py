@@ -0,0 +1,290 @@
+import itertools
+import threading
+from collections.abc import Mapping
+
+
+def iter_selections(event: dict):
+    """
+    Yields (market, market_line, selection) for every selection of an event.
+    market_line is None for markets without market_lines (e.g. moneyline), where
+    each entry of market['selections'] is itself a list of selections.
+    """
+    for market in event.get("markets", []):
+        if "market_lines" in market.keys():
+            for market_line in market.get("market_lines", []):
+                for selection in market_line.get("selections", []):
+                    yield market, market_line, selection[0]
+        else:
+            for selection in market.get("selections", []):
+                for select in selection:
+                    yield market, None, select
+
+
+def _selection_updates(info) -> dict:
+    return {selection.get("line_id"): selection for selection in (info if isinstance(info, list) else [info])}
+
+
+def find_update_target(sport_events, payload: dict, line_events: dict = None):
+    """
+    Returns the event_id a decoded websocket payload would change, without changing
+    anything, or None if the payload is not a book update. line_events, a
+    line_id -> event_id index, saves scanning the book for selection payloads that
+    do not name their event.
+    """
+    change_type = payload.get("change_type")
+    info = payload.get("info")
+    if change_type is None or info is None:
+        return None
+
+    if change_type == "sport_event":
+        return info.get("event_id")
+
+    if change_type == "market":
+        event_id = info.get("event_id", payload.get("event_id"))
+        return event_id if event_id in sport_events else None
+
+    if change_type in ("selection", "selections", "market_selections"):
+        event_id = payload.get("event_id")
+        if event_id in sport_events:
+            return event_id
+        line_ids = _selection_updates(info).keys()
+        if line_events is not None:
+            for line_id in line_ids:
+                if line_events.get(line_id) in sport_events:
+                    return line_events[line_id]
+            return None
+        for candidate in sport_events.keys():
+            if any(selection.get("line_id") in line_ids for _, _, selection in iter_selections(sport_events[candidate])):
+                return candidate
+        return None
+
+    return None
+
+
+def _updated_selection_lists(selection_lists: list, updates: dict, first_only: bool):
+    """
+    Copy of a list of selection lists with the updated selections replaced by
+    updated copies, or None if no selection in it was updated. Untouched lists and
+    selections are shared with the original.
+    """
+    updated = None
+    for index, selections in enumerate(selection_lists):
+        updated_selections = None
+        for position, selection in enumerate(selections[:1] if first_only else selections):
+            update = updates.get(selection.get("line_id"))
+            if update is None:
+                continue
+            if updated_selections is None:
+                updated_selections = list(selections)
+            updated_selections[position] = {**selection, **update}
+        if updated_selections is not None:
+            if updated is None:
+                updated = list(selection_lists)
+            updated[index] = updated_selections
+    return updated
+
+
+def _updated_event(event, payload: dict):
+    """
+    The event after applying a payload to it, or None if the payload removes it.
+    The given event is never mutated: only the dicts and lists on the path from the
+    event to what changed are copied, everything else is shared.
+    """
+    change_type = payload["change_type"]
+    info = payload["info"]
+
+    if change_type == "sport_event":
+        if payload.get("op") == "d":
+            return None
+        updated = dict(event) if event is not None else {"markets": []}
+        updated.update({key: value for key, value in info.items() if key != "markets"})
+        return updated
+
+    markets = list(event.get("markets", []))
+    if change_type == "market":
+        for index, market in enumerate(markets):
+            if market.get("id") == info.get("id"):
+                if payload.get("op") == "d":
+                    markets.pop(index)
+                else:
+                    markets[index] = info
+                break
+        else:
+            if payload.get("op") != "d":
+                markets.append(info)
+        return {**event, "markets": markets}
+
+    updates = _selection_updates(info)
+    for index, market in enumerate(markets):
+        if "market_lines" in market.keys():
+            market_lines = None
+            for line_index, market_line in enumerate(market.get("market_lines", [])):
+                selections = _updated_selection_lists(market_line.get("selections", []), updates, first_only=True)
+                if selections is None:
+                    continue
+                if market_lines is None:
+                    market_lines = list(market["market_lines"])
+                market_lines[line_index] = {**market_line, "selections": selections}
+            if market_lines is not None:
+                markets[index] = {**market, "market_lines": market_lines}
+        else:
+            selections = _updated_selection_lists(market.get("selections", []), updates, first_only=False)
+            if selections is not None:
+                markets[index] = {**market, "selections": selections}
+    return {**event, "markets": markets}
+
+
+def apply_update(sport_events: dict, payload: dict):
+    """
+    Applies one decoded websocket payload to the book and returns the event_id it
+    touched, or None if the payload was not a book update. The touched event is
+    replaced by an updated copy (see _updated_event), never mutated.
+
+    Payloads carry a change_type, an op ('c'/'u'/'d') and an info object:
+    - sport_event: info is the event (without markets); 'd' removes the event
+    - market: info is a market of info['event_id'], upserted by market id
+    - selection(s): info is one selection or a list of them, matched by line_id
+    """
+    event_id = find_update_target(sport_events, payload)
+    if event_id is None:
+        return None
+    event = _updated_event(sport_events.get(event_id), payload)
+    if event is None:
+        sport_events.pop(event_id, None)
+    else:
+        sport_events[event_id] = event
+    return event_id
+
+
+_BUCKETS = 64  # Top-level buckets of a snapshot; a write copies only the buckets it touches
+
+
+def _bucket(event_id) -> int:
+    return hash(event_id) % _BUCKETS
+
+
+class BookSnapshot(Mapping):
+    """
+    Read-only view of the book at one version. The underlying dicts are never
+    mutated once published, so a snapshot can be iterated from any thread while
+    updates are applied.
+
+    Events are spread over _BUCKETS dicts by hash of event_id, so publishing a
+    version copies only the buckets that changed instead of the whole index.
+    """
+    __slots__ = ("_buckets", "_size", "version")
+
+    def __init__(self, buckets: tuple, size: int, version: int):
+        self._buckets = buckets
+        self._size = size
+        self.version = version
+
+    def __getitem__(self, event_id):
+        return self._buckets[_bucket(event_id)][event_id]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._buckets)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, event_id):
+        return event_id in self._buckets[_bucket(event_id)]
+
+    def get(self, event_id, default=None):
+        return self._buckets[_bucket(event_id)].get(event_id, default)
+
+    def items(self):
+        return itertools.chain.from_iterable(bucket.items() for bucket in self._buckets)
+
+    def values(self):
+        return itertools.chain.from_iterable(bucket.values() for bucket in self._buckets)
+
+
+class VersionedBook:
+    """
+    sport_events with copy-on-write versions.
+
+    Writers never mutate a published event: every change copies only the path from
+    the snapshot down to what changed (bucket, event, markets list, market, selection)
+    and shares everything else with the previous version, then publishes the result
+    as the next snapshot with a single reference swap. Readers (flattener, sinks,
+    trading) take snapshot() and get a consistent view for as long as they hold it.
+    Writers are serialised by a lock; readers never take it.
+    """
+
+    def __init__(self):
+        self._snapshot = BookSnapshot(tuple(dict() for _ in range(_BUCKETS)), 0, 0)
+        self._line_events = dict()  # line_id -> event_id, kept by writers under the lock
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def snapshot(self) -> BookSnapshot:
+        return self._snapshot
+
+    def _index(self, event_id, event: dict, add: bool):
+        for _, _, selection in iter_selections(event):
+            line_id = selection.get("line_id")
+            if add:
+                self._line_events[line_id] = event_id
+            elif self._line_events.get(line_id) == event_id:
+                del self._line_events[line_id]
+
+    def _publish(self, changes: dict, reindex: bool = True):
+        """
+        Publishes the next version with changes (event_id -> event, or None to remove
+        the event) applied. reindex=False skips the line_id index for changes that
+        can not add or remove selections.
+        """
+        current = self._snapshot
+        buckets = list(current._buckets)
+        copied = set()
+        size = current._size
+        for event_id, event in changes.items():
+            index = _bucket(event_id)
+            if index not in copied:
+                buckets[index] = dict(buckets[index])
+                copied.add(index)
+            bucket = buckets[index]
+            previous = bucket.get(event_id)
+            if reindex and previous is not None:
+                self._index(event_id, previous, add=False)
+            if event is None:
+                if bucket.pop(event_id, None) is not None:
+                    size -= 1
+                continue
+            if previous is None:
+                size += 1
+            bucket[event_id] = event
+            if reindex:
+                self._index(event_id, event, add=True)
+        self._snapshot = BookSnapshot(tuple(buckets), size, current.version + 1)
+
+    def put_many(self, events: dict):
+        """
+        Adds or replaces whole events in one version. The book takes ownership of
+        the event dicts; callers must not mutate them afterwards.
+        """
+        if not events:
+            return
+        with self._lock:
+            self._publish(events)
+
+    def put(self, event_id, event: dict):
+        self.put_many({event_id: event})
+
+    def apply_update(self, payload: dict):
+        """
+        Copy-on-write version of apply_update: only the path to what changed is copied.
+        """
+        with self._lock:
+            current = self._snapshot
+            event_id = find_update_target(current, payload, self._line_events)
+            if event_id is None:
+                return None
+            event = _updated_event(current.get(event_id), payload)
+            self._publish({event_id: event}, reindex=payload["change_type"] in ("sport_event", "market"))
+            return event_id
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import deque
+
+from book import iter_selections
+
+# Values tracked per selection in the last-value cache
+TRACKED_FIELDS = ("odds", "stake", "value", "status", "updated_at")
+
+
+def selection_values(market: dict, selection: dict) -> tuple:
+    """
+    The tracked values of one selection, in TRACKED_FIELDS order.
+    Status and updated_at are taken from the market the selection belongs to.
+    """
+    return (
+        selection.get("odds"),
+        selection.get("stake"),
+        selection.get("value"),
+        market.get("status"),
+        market.get("updated_at"),
+    )
+
+
+class OddsChangeFeed:
+    """
+    Last-value cache per selection (keyed by line_id) that turns book updates into
+    change records.
+
+    Observed values are compared with the cache and only real changes are kept.
+    Changes to the same selection within coalesce_window seconds are merged into one
+    record, keeping the value before the burst and the latest value. With auto_flush,
+    a timer publishes the window as soon as it has elapsed, so the last change of a
+    burst reaches subscribers without waiting for another update; without it,
+    records are published by the next observe/flush/changes_* call. Published
+    records are kept in a bounded history, so consumers can ask for everything that
+    changed since a timestamp, or register a callback to be pushed new records.
+
+    A change record is a dict:
+        {'seq', 'emitted_at', 'line_id', 'event_id', 'market_id', 'previous', 'current'}
+    where previous/current map TRACKED_FIELDS to values (previous is None for new
+    lines, current is None for lines that left the book).
+    """
+
+    def __init__(self, coalesce_window: float = 1.0, max_history: int = 100000, auto_flush: bool = True):
+        self.coalesce_window = coalesce_window
+        self.auto_flush = auto_flush
+        self._last = dict()                        # line_id -> tuple of tracked values
+        self._event_lines = dict()                 # event_id -> {line_id: market_id} last observed
+        self._pending = dict()                     # line_id -> change record not yet published
+        self._window_started = None                # When the first pending change arrived
+        self._history = deque(maxlen=max_history)  # Published change records, oldest first
+        self._subscribers = []
+        self._seq = 0
+        self._timer = None                         # Publishes the open window when it elapses
+        self._lock = threading.Lock()
+
+    def _queue_change(self, event_id, market_id, line_id, previous: tuple, current: tuple, now: float):
+        pending = self._pending.get(line_id)
+        if pending is not None:
+            # Coalesce with the change already waiting in this window
+            pending["current"] = None if current is None else dict(zip(TRACKED_FIELDS, current))
+            return
+        if self._window_started is None:
+            self._window_started = now
+            if self.auto_flush:
+                self._timer = threading.Timer(self.coalesce_window, self._flush_window, args=(now,))
+                self._timer.daemon = True
+                self._timer.start()
+        self._pending[line_id] = {
+            "line_id": line_id,
+            "event_id": event_id,
+            "market_id": market_id,
+            "previous": None if previous is None else dict(zip(TRACKED_FIELDS, previous)),
+            "current": None if current is None else dict(zip(TRACKED_FIELDS, current)),
+        }
+
+    def observe_event(self, event_id, event: dict, now: float = None) -> int:
+        """
+        Compares every selection of one event with the cache and queues the ones that
+        changed, or left the event since it was last observed. event None means the
+        event left the book. Returns how many selections changed.
+        """
+        now = time.time() if now is None else now
+        changed = 0
+        with self._lock:
+            seen = dict()
+            for market, _, selection in iter_selections(event or {}):
+                line_id = selection.get("line_id")
+                if line_id is None:
+                    continue
+                seen[line_id] = market.get("id")
+                current = selection_values(market, selection)
+                previous = self._last.get(line_id)
+                if previous == current:
+                    continue
+                self._last[line_id] = current
+                changed += 1
+                self._queue_change(event_id, market.get("id"), line_id, previous, current, now)
+
+            for line_id, market_id in self._event_lines.pop(event_id, {}).items():
+                if line_id in seen:
+                    continue
+                previous = self._last.pop(line_id, None)
+                if previous is not None:
+                    changed += 1
+                    self._queue_change(event_id, market_id, line_id, previous, None, now)
+            if seen:
+                self._event_lines[event_id] = seen
+        self.flush(now=now)
+        return changed
+
+    def observe_book(self, sport_events: dict, now: float = None) -> int:
+        """
+        Observes every event of a book, e.g. right after seeding.
+        """
+        now = time.time() if now is None else now
+        return sum(self.observe_event(event_id, event, now=now) for event_id, event in sport_events.items())
+
+    def flush(self, now: float = None, force: bool = False) -> list:
+        """
+        Publishes the pending changes once the coalescing window has elapsed (or
+        immediately with force) and returns the published records.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            published = self._flush_locked(now, force)
+            subscribers = list(self._subscribers)
+        self._notify(subscribers, published)
+        return published
+
+    def _flush_locked(self, now: float, force: bool) -> list:
+        if self._window_started is None:
+            return []
+        if not force and now - self._window_started < self.coalesce_window:
+            return []
+        published = []
+        for record in self._pending.values():
+            if record["previous"] == record["current"]:
+                continue  # The burst ended where it started
+            self._seq += 1
+            record["seq"] = self._seq
+            record["emitted_at"] = now
+            published.append(record)
+        self._history.extend(published)
+        self._pending = dict()
+        self._window_started = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return published
+
+    @staticmethod
+    def _notify(subscribers: list, published: list):
+        if published:
+            for callback in subscribers:
+                callback(published)
+
+    def _flush_window(self, window_started: float):
+        # Timer callback. Checked and published under one lock, so a window that was
+        # already published and replaced by a newer one is never cut short
+        with self._lock:
+            if self._window_started != window_started:
+                return
+            published = self._flush_locked(time.time(), force=True)
+            subscribers = list(self._subscribers)
+        self._notify(subscribers, published)
+
+    def changes_since(self, since: float) -> list:
+        """
+        Returns the published change records emitted after the given timestamp.
+        """
+        self.flush()
+        with self._lock:
+            changes = []
+            for record in reversed(self._history):
+                if record["emitted_at"] <= since:
+                    break
+                changes.append(record)
+        changes.reverse()
+        return changes
+
+    def changes_after(self, seq: int) -> list:
+        """
+        Returns the published change records with a sequence number above seq.
+        """
+        self.flush()
+        with self._lock:
+            return [record for record in self._history if record["seq"] > seq]
+
+    def subscribe(self, callback):
+        """
+        Registers callback(records) to be called with every published batch.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def last_value(self, line_id) -> dict:
+        """
+        The cached values of one selection, or None if it was never observed.
+        """
+        with self._lock:
+            values = self._last.get(line_id)
+        return None if values is None else dict(zip(TRACKED_FIELDS, values))
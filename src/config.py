@@ -1,4 +1,5 @@
 import json
+from functools import lru_cache
 from dotenv import load_dotenv
 import os
 
@@ -7,15 +8,35 @@ load_dotenv(override=True)
 # Get the absolute path of the file
 file_path = os.path.join(os.path.dirname(__file__), "user_info.json")
 
-with open(file_path) as fp:
-    user_info_dict = json.load(fp)
 
-MM_KEYS = {
-    "access_key": user_info_dict["access_key"],
-    "secret_key": user_info_dict["secret_key"],
-}
+@lru_cache(maxsize=None)
+def load_user_info() -> dict:
+    """
+    Reads user_info.json on first use, so importing config stays cheap for
+    commands that never talk to the MM API.
+    """
+    with open(file_path) as fp:
+        return json.load(fp)
+
+
+def __getattr__(name):
+    # MM_KEYS, MM_ACCOUNTS, INGEST_FILTERS and TOURNAMENTS_INTERESTED are resolved lazily from user_info.json
+    if name == "MM_KEYS":
+        user_info_dict = load_user_info()
+        return {
+            "access_key": user_info_dict["access_key"],
+            "secret_key": user_info_dict["secret_key"],
+        }
+    if name == "TOURNAMENTS_INTERESTED":
+        return load_user_info()["tournaments"]
+    if name == "INGEST_FILTERS":
+        # Optional "filters" object, see filters.IngestFilter
+        return load_user_info().get("filters", {})
+    if name == "MM_ACCOUNTS":
+        # Optional "accounts" list of access/secret key pairs for sharded runs
+        return load_user_info().get("accounts") or [__getattr__("MM_KEYS")]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-TOURNAMENTS_INTERESTED = user_info_dict["tournaments"]
 
 BASE_URL = "https://api-ss-sandbox.betprophet.co"
 URL = {
@@ -0,0 +1,121 @@
+import queue
+import threading
+
+import sheets
+from log import logging
+from profiling import profiled
+from sinks import event_tournament
+
+_DONE = object()  # Sentinel telling a sink worker the book is exhausted
+
+
+class FanOut:
+    """
+    Flattens the book once and fans the rows out to several sinks concurrently.
+
+    Every sink gets its own worker thread and a bounded queue of row batches
+    (sink.buffer_size if the sink defines it, else buffer_size). The flattener
+    blocks only when a sink's queue is full, which is the backpressure; until then
+    each sink drains at its own pace, so a slow sink such as Sheets does not delay
+    the fast ones. A sink that raises is logged and skipped from then on, without
+    stopping the others.
+
+    Sinks implement open(header), write_rows(rows, tournament) and close(), all
+    called from the sink's own worker thread.
+    """
+
+    def __init__(self, sinks: list, buffer_size: int = 64, batch_rows: int = 1000):
+        self.sinks = sinks
+        self.buffer_size = buffer_size
+        self.batch_rows = batch_rows
+        self.errors = dict()  # sink -> exception raised by it
+
+    def _worker(self, sink, batches: queue.Queue):
+        done = False     # _DONE was taken off the queue
+        closing = False  # close() was reached, so abort() must not run after it
+        try:
+            sink.open(sheets.HEADER)
+            while True:
+                batch = batches.get()
+                if batch is _DONE:
+                    done = True
+                    break
+                for tournament, rows in batch:
+                    sink.write_rows(rows, tournament)
+            closing = True
+            sink.close()
+        except Exception as e:
+            logging.error(f"sink {type(sink).__name__} failed: {e}")
+            self.errors[sink] = e
+            if not closing:
+                _abort(sink)
+            # Keep draining so the flattener never blocks on a dead sink
+            while not done:
+                done = batches.get() is _DONE
+
+    def _batches(self, mm_instance):
+        """
+        Yields lists of (tournament, rows), each holding about batch_rows rows.
+        """
+        batch, size = [], 0
+        for event_id, event_data in mm_instance.sport_events.items():
+            rows = sheets.event_rows(event_id, event_data)
+            if not rows:
+                continue
+            batch.append((event_tournament(mm_instance, event_data), rows))
+            size += len(rows)
+            if size >= self.batch_rows:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    @profiled("export_flatten")
+    def _flatten(self, mm_instance, queues: list) -> int:
+        """
+        Flattens the book into every sink queue, then closes the queues. Runs on the
+        caller's thread, so profiling it covers flattening but not the sink writes.
+        Returns the number of rows.
+        """
+        n_rows = 0
+        try:
+            for batch in self._batches(mm_instance):
+                n_rows += sum(len(rows) for _, rows in batch)
+                for batches in queues:
+                    batches.put(batch)  # Blocks while this sink's buffer is full
+        finally:
+            # Also on a flattener error, so no worker waits forever
+            for batches in queues:
+                batches.put(_DONE)
+        return n_rows
+
+    def run(self, mm_instance) -> dict:
+        """
+        Exports the book of mm_instance to every sink and waits for all of them.
+        Returns the errors by sink, empty when every sink succeeded.
+        """
+        queues, workers = [], []
+        for sink in self.sinks:
+            batches = queue.Queue(maxsize=getattr(sink, "buffer_size", self.buffer_size))
+            worker = threading.Thread(target=self._worker, args=(sink, batches),
+                                      name=f"sink-{type(sink).__name__}", daemon=True)
+            worker.start()
+            queues.append(batches)
+            workers.append(worker)
+
+        n_rows = self._flatten(mm_instance, queues)
+        for worker in workers:
+            worker.join()
+
+        logging.info(f"exported {n_rows} rows to {len(self.sinks) - len(self.errors)}/{len(self.sinks)} sinks")
+        return self.errors
+
+
+def _abort(sink):
+    """
+    Releases a failed sink, with abort() if it has one, else close().
+    """
+    try:
+        getattr(sink, "abort", sink.close)()
+    except Exception as e:
+        logging.error(f"sink {type(sink).__name__} could not be aborted: {e}")
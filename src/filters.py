@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+
+# Fields projection never drops: they key the book, hold the selections or are
+# read unconditionally by the flattener and start_playing
+REQUIRED_EVENT_FIELDS = ("event_id", "name", "display_name", "scheduled", "status", "competitors", "markets",
+                         "tournament_name")
+REQUIRED_MARKET_FIELDS = ("id", "type", "updated_at", "selections", "market_lines")
+
+
+class IngestFilter:
+    """
+    Filters and projects events/markets as they are ingested, so unwanted markets
+    are never stored, flattened or exported.
+
+    Configured from the optional "filters" object of user_info.json:
+        market_types           e.g. ["moneyline", "spread"]
+        market_statuses        e.g. ["active"]
+        event_statuses         e.g. ["not_started", "live"]
+        scheduled_from_hours   keep events scheduled at most this many hours ago (e.g. -6)
+        scheduled_to_hours     keep events scheduled at most this many hours ahead (e.g. 48)
+        event_fields           event keys to keep (REQUIRED_EVENT_FIELDS are always kept)
+        market_fields          market keys to keep (REQUIRED_MARKET_FIELDS are always kept)
+    Every option is optional; an empty filter keeps everything.
+    """
+
+    def __init__(self, market_types: list = None, market_statuses: list = None, event_statuses: list = None,
+                 scheduled_from_hours: float = None, scheduled_to_hours: float = None,
+                 event_fields: list = None, market_fields: list = None):
+        self.market_types = set(market_types) if market_types else None
+        self.market_statuses = set(market_statuses) if market_statuses else None
+        self.event_statuses = set(event_statuses) if event_statuses else None
+        self.scheduled_from_hours = scheduled_from_hours
+        self.scheduled_to_hours = scheduled_to_hours
+        self.event_fields = set(event_fields).union(REQUIRED_EVENT_FIELDS) if event_fields else None
+        self.market_fields = set(market_fields).union(REQUIRED_MARKET_FIELDS) if market_fields else None
+
+    @classmethod
+    def from_config(cls, filters: dict) -> "IngestFilter":
+        return cls(**(filters or {}))
+
+    def accept_event(self, event: dict, now: datetime = None) -> bool:
+        """
+        Checks event status and scheduled time. Missing fields (e.g. in partial
+        websocket updates) never reject an event.
+        """
+        if self.event_statuses is not None and event.get("status") not in (None, *self.event_statuses):
+            return False
+        if (self.scheduled_from_hours is None and self.scheduled_to_hours is None) or not event.get("scheduled"):
+            return True
+        scheduled = datetime.strptime(event["scheduled"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        now = now or datetime.now(timezone.utc)
+        if self.scheduled_from_hours is not None and scheduled < now + timedelta(hours=self.scheduled_from_hours):
+            return False
+        if self.scheduled_to_hours is not None and scheduled > now + timedelta(hours=self.scheduled_to_hours):
+            return False
+        return True
+
+    def accept_market(self, market: dict) -> bool:
+        if self.market_types is not None and market.get("type") not in self.market_types:
+            return False
+        if self.market_statuses is not None and market.get("status") not in (None, *self.market_statuses):
+            return False
+        return True
+
+    def project_market(self, market: dict) -> dict:
+        if self.market_fields is None:
+            return market
+        return {key: value for key, value in market.items() if key in self.market_fields}
+
+    def filter_markets(self, markets: list) -> list:
+        return [self.project_market(market) for market in markets if self.accept_market(market)]
+
+    def apply(self, event: dict):
+        """
+        Returns the filtered, projected event, or None if nothing of it is wanted.
+        """
+        if not self.accept_event(event):
+            return None
+        markets = self.filter_markets(event.get("markets", []))
+        if not markets and self.market_types is not None:
+            return None
+        event["markets"] = markets
+        if self.event_fields is not None:
+            event = {key: value for key, value in event.items() if key in self.event_fields}
+        return event
+
+    def filter_update(self, payload: dict) -> dict:
+        """
+        Filters a decoded websocket payload (see book.apply_update). Events or markets
+        that no longer pass the filter are turned into deletes so they leave the book.
+        """
+        change_type = payload.get("change_type")
+        info = payload.get("info")
+        if info is None or payload.get("op") == "d":
+            return payload
+        if change_type == "sport_event":
+            if not self.accept_event(info):
+                return {**payload, "op": "d"}
+            if self.event_fields is not None:
+                return {**payload, "info": {key: value for key, value in info.items() if key in self.event_fields}}
+        elif change_type == "market":
+            if not self.accept_market(info):
+                return {**payload, "op": "d"}
+            projected = self.project_market(info)
+            if "event_id" in info:
+                projected = {**projected, "event_id": info["event_id"]}
+            return {**payload, "info": projected}
+        return payload
@@ -1,10 +1,150 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+import time
 
-logging.basicConfig(
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ])
\ No newline at end of file
+# Logging settings, all overridable from the environment
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_FILE = os.path.join(LOG_DIR, "app.log")
+if multiprocessing.current_process().name != "MainProcess":
+    # Worker processes (e.g. mm-shard-0) rotate their own file, app-mm-shard-0.log
+    LOG_FILE = os.path.join(LOG_DIR, f"app-{multiprocessing.current_process().name}.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()                     # "text" or "json"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))        # Rotate app.log at this size
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))                 # Rotated files to keep
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))                 # Records buffered for the writer
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", 5))                   # Records/second per rate_key
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-8s %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'rate_key', None):
+            entry['rate_key'] = record.rate_key
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per `rate_key`, for high-frequency messages logged with
+    extra={'rate_key': ...}. Records without a rate_key always pass. The next
+    record let through for a key reports how many were suppressed before it.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._buckets = dict()  # rate_key -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate_key = getattr(record, 'rate_key', None)
+        if rate_key is None or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(rate_key, [self.burst, now, 0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking or raising when the
+    bounded queue is full, so callers on hot paths never wait on log I/O. The
+    next record that fits reports how many were dropped before it, and
+    take_dropped() hands over any count still unreported, e.g. at shutdown.
+    """
+
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0      # Records dropped since start
+        self._unreported = 0  # Dropped records not yet reported in a message
+
+    def enqueue(self, record: logging.LogRecord):
+        # Called under the handler lock, so the counters need no lock of their own
+        message = record.msg
+        if self._unreported:
+            record.msg = f"{message} ({self._unreported} records dropped, log queue full)"
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            record.msg = message
+            self.dropped += 1
+            self._unreported += 1
+        else:
+            self._unreported = 0
+
+    def take_dropped(self) -> int:
+        """
+        Returns the number of dropped records not yet reported, and resets it.
+        """
+        self.acquire()
+        try:
+            unreported, self._unreported = self._unreported, 0
+        finally:
+            self.release()
+        return unreported
+
+os.makedirs(LOG_DIR, exist_ok=True)
+
+_formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+_file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                                     backupCount=LOG_BACKUP_COUNT)
+_stream_handler = logging.StreamHandler()
+for _handler in (_file_handler, _stream_handler):
+    _handler.setFormatter(_formatter)
+
+_queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Final formatting happens in the listener
+_queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT))
+
+# The listener thread does the file/stream writes; callers only enqueue
+listener = logging.handlers.QueueListener(_queue_handler.queue, _file_handler, _stream_handler,
+                                          respect_handler_level=True)
+listener.start()
+
+
+def _stop_listener():
+    """
+    Stops the listener, then writes a final report of records dropped since the
+    last one straight to the handlers, as the queue is no longer drained.
+    """
+    listener.stop()
+    dropped = _queue_handler.take_dropped()
+    if dropped:
+        listener.handle(logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                          "%d log records dropped, log queue full", (dropped,), None))
+
+
+atexit.register(_stop_listener)
+
+logging.basicConfig(level=LOG_LEVEL, handlers=[_queue_handler])
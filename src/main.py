@@ -1,203 +1,205 @@
-from datetime import datetime, timezone
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-import mm_calls
+import argparse
+import sys
 from log import logging
-from config import SERVICE_ACCOUNT_FILE, SHEET_NAME, SPREADSHEET_ID
-import pytz
 
 
-# Scope for Sheets API access
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+def _seeded_instance(change_feed=None):
+    """
+    Logs into the MM API and seeds tournaments/events/markets.
+    """
+    import mm_calls
+
+    mm_instance = mm_calls.MMInteractions(change_feed=change_feed)
+    mm_instance.mm_login()
+    mm_instance.seeding()  # After this, mm_instance.sport_events should be populated
+    return mm_instance
 
-# Authenticate and create a service object
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES
-)
 
-service = build("sheets", "v4", credentials=credentials)
+def _seeded_supervisor(args, live=False, trade=False, change_feed=None, publish_interval=30):
+    """
+    Seeds the tournaments across args.workers processes and returns the supervisor
+    holding the merged book. Live workers publish changes every publish_interval seconds.
+    """
+    from supervisor import Supervisor
 
+    supervisor = Supervisor(n_workers=args.workers, live=live, trade=trade, publish_interval=publish_interval,
+                            change_feed=change_feed)
+    supervisor.start()
+    try:
+        supervisor.wait_seeded()
+    except BaseException:
+        supervisor.stop()
+        raise
+    return supervisor
 
-# Google Sheets function to write data
-def write_to_sheet(sheet_name, data):
 
+def _run_supervisor_forever(supervisor):
+    """
+    Keeps merging the books published by live workers until interrupted.
+    """
     try:
-        # Write data to Google Sheets
-        sheet_range = sheet_name + "!A1"
-        body = {"values": data}
-        service.spreadsheets().values().append(
-            spreadsheetId=SPREADSHEET_ID,
-            range=sheet_range,
-            body=body,
-            valueInputOption="RAW",
-        ).execute()
-        logging.info(f"Successfully wrote data to {sheet_name}")
-    except HttpError as err:
-        logging.error(f"Error occurred while writing to Google Sheets: {err}")
-
-
-def extract_event_data_for_sheets(mm_instance):
+        while True:
+            supervisor.poll()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Workers are not daemons, so they must be stopped on any exit
+        supervisor.stop()
+
+
+def seed(args):
     """
-    Extracts event and market data from mm_instance.sport_events and returns it
-    in a list-of-lists format suitable for Google Sheets.
+    Seeds the book and reports what was ingested, without touching Google Sheets.
+    """
+    if args.workers > 1:
+        _seeded_supervisor(args).stop()
+        return
+    mm_instance = _seeded_instance()
+    if args.balance:
+        mm_instance.get_balance()
+
 
-    Each row could represent:
-    Event Name | Market Type | Selection Name | Line ID
+def export(args):
+    """
+    Seeds the book once, flattens it once and fans the rows out to every --sink
+    (Google Sheets, partitioned Parquet / gzip CSV files, SQLite, stdout).
+    With --dry-run the rows are only counted, so Google auth is skipped entirely.
+    Returns 1 if any sink failed.
+    """
+    import sheets
+
+    if args.workers > 1:
+        mm_instance = _seeded_supervisor(args)
+        mm_instance.stop()
+    else:
+        mm_instance = _seeded_instance()
+
+    if args.dry_run:
+        # Extract the event/market data to a format suitable for Sheets
+        data_to_write = sheets.extract_event_data_for_sheets(mm_instance)
+        logging.info(f"dry run, {len(data_to_write) - 1} rows would be written")
+        return
+
+    from fanout import FanOut
+
+    errors = FanOut(_build_sinks(args)).run(mm_instance)
+    if errors:
+        return 1
+
+
+def _build_sinks(args) -> list:
+    import sinks
+    from config import SHEET_NAME
+
+    built = []
+    for name in dict.fromkeys(args.sink or ["sheets"]):
+        if name == "sheets":
+            built.append(sinks.SheetsSink(args.sheet_name or SHEET_NAME))
+        elif name == "parquet":
+            built.append(sinks.ParquetSink(root=args.output_dir))
+        elif name == "csv":
+            built.append(sinks.CsvSink(root=args.output_dir))
+        elif name == "sqlite":
+            built.append(sinks.SqliteSink(path=args.sqlite_path))
+        elif name == "stdout":
+            built.append(sinks.StdoutSink())
+    return built
+
+
+def watch(args):
     """
+    Seeds the book, keeps it current from the websocket and keeps the sheet live by
+    flushing only the changed rows every --flush-interval seconds.
+    """
+    from changefeed import OddsChangeFeed
+    from config import SHEET_NAME
+    from watch import SheetWatcher
+
+    change_feed = OddsChangeFeed(coalesce_window=args.coalesce_window)
+    if args.workers > 1:
+        supervisor = _seeded_supervisor(args, live=True, change_feed=change_feed,
+                                        publish_interval=args.flush_interval)
+        try:
+            watcher = SheetWatcher(supervisor, args.sheet_name or SHEET_NAME, flush_interval=args.flush_interval,
+                                   max_calls_per_minute=args.max_calls_per_minute)
+            watcher.run_forever(wait=lambda: supervisor.poll(timeout=args.flush_interval))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Workers are not daemons, so they must be stopped on any exit
+            supervisor.stop()
+        return
+
+    mm_instance = _seeded_instance(change_feed=change_feed)
+    mm_instance.subscribe()
+    mm_instance.schedule_session_refresh()
+    mm_instance.keep_alive()
+    watcher = SheetWatcher(mm_instance, args.sheet_name or SHEET_NAME, flush_interval=args.flush_interval,
+                           max_calls_per_minute=args.max_calls_per_minute)
+    watcher.run_forever()
 
-    # Define headers for the sheet
-    data_to_write = [
-        [
-            "Event ID",
-            "Event Scheduled Time",
-            "Event Name",
-            "Event Competitor 1",
-            "Event Competitor 1 Abbreviation",
-            "Event Competitor 1 Side",
-            "Event Competitor 2",
-            "Event Competitor 2 Abbreviation",
-            "Event Competitor 2 Side",
-            "Market ID",
-            "Market Name",
-            "Market Type",
-            "Market Status",
-            "Market Line ID",
-            "Market Line Name",
-            "Market Line",
-            "Market Line Favourite",
-            "Market Line Type",
-            "Selection ID",
-            "Selection Name",
-            "Selection Odds",
-            "Event Status",
-            "Selection Stake",
-            "Selection Value",
-            "Market Updated",
-        ]
-    ]
-
-    for event_id, event_data in mm_instance.sport_events.items():
-        for market in event_data.get("markets", []):
-            if "market_lines" in market.keys():
-                for market_line in market.get("market_lines", []):
-                    for selection in market_line.get("selections", []):
-                        data_to_write.append(
-                            # Create row data dictionary
-                            [
-                                event_id,
-                                datetime.strptime(
-                                    event_data.get("scheduled", ""),
-                                    "%Y-%m-%dT%H:%M:%SZ",
-                                )
-                                .replace(tzinfo=pytz.UTC)
-                                .astimezone(pytz.timezone("America/New_York"))
-                                .__str__(),
-                                event_data.get("display_name", ""),
-                                event_data.get("competitors", [{}])[0].get(
-                                    "display_name", ""
-                                ),
-                                event_data.get("competitors", [{}])[0].get(
-                                    "abbreviation", ""
-                                ),
-                                event_data.get("competitors", [{}])[0].get("side", ""),
-                                event_data.get("competitors", [{}])[1].get(
-                                    "display_name", ""
-                                ),
-                                event_data.get("competitors", [{}])[1].get(
-                                    "abbreviation", ""
-                                ),
-                                event_data.get("competitors", [{}])[1].get("side", ""),
-                                market.get("id", ""),
-                                market.get("name", ""),
-                                market.get("type", ""),
-                                market.get("status", ""),
-                                market_line.get("id", ""),
-                                market_line.get("name", ""),
-                                market_line.get("line", ""),
-                                market_line.get("favourite", "NA"),
-                                market_line.get("type", ""),
-                                selection[0].get("line_id", ""),
-                                selection[0].get("display_name", ""),
-                                selection[0].get("odds", ""),
-                                event_data.get("status", ""),
-                                selection[0].get("stake", ""),
-                                selection[0].get("value", ""),
-                                datetime.utcfromtimestamp(
-                                    market.get("updated_at", "0") / 1e9
-                                )
-                                .replace(tzinfo=timezone.utc)
-                                .astimezone(pytz.timezone("US/Eastern"))
-                                .__str__(),
-                            ]
-                        )
-            else:
-                for selection in market.get("selections", []):
-                    for select in selection:
-                        data_to_write.append(
-                            # Create row data dictionary
-                            [
-                                event_id,
-                                event_data.get("scheduled", ""),
-                                event_data.get("display_name", ""),
-                                event_data.get("competitors", [{}])[0].get(
-                                    "display_name", ""
-                                ),
-                                event_data.get("competitors", [{}])[0].get(
-                                    "abbreviation", ""
-                                ),
-                                event_data.get("competitors", [{}])[0].get("side", ""),
-                                event_data.get("competitors", [{}])[1].get(
-                                    "display_name", ""
-                                ),
-                                event_data.get("competitors", [{}])[1].get(
-                                    "abbreviation", ""
-                                ),
-                                event_data.get("competitors", [{}])[1].get("side", ""),
-                                market.get("id", ""),
-                                market.get("name", ""),
-                                market.get("type", ""),
-                                market.get("status", ""),
-                                "NA",
-                                "NA",
-                                "NA",
-                                "NA",
-                                "NA",
-                                select.get("line_id", ""),
-                                select.get("display_name", ""),
-                                select.get("odds", ""),
-                                event_data.get("status", ""),
-                                select.get("stake", ""),
-                                select.get("value", ""),
-                                datetime.fromtimestamp(
-                                    market.get("updated_at", "0") / 1e9
-                                ).__str__(),
-                            ]
-                        )
-    return data_to_write
-
-
-# Main code execution
-if True:
-    logging.info("Testing MM api")
-
-    mm_instance = mm_calls.MMInteractions()
-    mm_instance.mm_login()
-    # mm_instance.get_balance()
-    mm_instance.seeding()  # After this, mm_instance.sport_events should be populated
+
+def trade(args):
+    """
+    Seeds the book, subscribes to the websocket and schedules the playing jobs.
+    """
+    if args.workers > 1:
+        _run_supervisor_forever(_seeded_supervisor(args, live=True, trade=True))
+        return
+    mm_instance = _seeded_instance()
     mm_instance.subscribe()
+    mm_instance.auto_playing()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Sports betting data pipeline")
+    parser.add_argument("--profile", default=None,
+                        help="comma separated profiling modes: cpu, pyinstrument, mem (same as MM_PROFILE)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="seed tournaments/events/markets and exit")
+    seed_parser.add_argument("--balance", action="store_true", help="also fetch the account balance")
+    seed_parser.set_defaults(func=seed)
+
+    export_parser = subparsers.add_parser("export", help="seed once and write the book to Google Sheets")
+    export_parser.add_argument("--sheet-name", default=None, help="defaults to SHEET_NAME from .env")
+    export_parser.add_argument("--sink", action="append", choices=["sheets", "parquet", "csv", "sqlite", "stdout"],
+                               help="export target, repeat to write to several at once (default: sheets); "
+                                    "csv is gzip compressed")
+    export_parser.add_argument("--output-dir", default="exports", help="root directory of file exports")
+    export_parser.add_argument("--sqlite-path", default="exports/odds.sqlite", help="database of the sqlite sink")
+    export_parser.add_argument("--dry-run", action="store_true", help="flatten the book but do not write it")
+    export_parser.set_defaults(func=export)
+
+    watch_parser = subparsers.add_parser("watch", help="keep the sheet live from websocket updates")
+    watch_parser.add_argument("--sheet-name", default=None, help="defaults to SHEET_NAME from .env")
+    watch_parser.add_argument("--flush-interval", type=float, default=10,
+                              help="seconds between flushes of changed rows")
+    watch_parser.add_argument("--max-calls-per-minute", type=int, default=30,
+                              help="cap on Google Sheets API calls per minute")
+    watch_parser.add_argument("--coalesce-window", type=float, default=1.0,
+                              help="seconds within which repeated changes to a selection are merged")
+    watch_parser.set_defaults(func=watch)
+
+    trade_parser = subparsers.add_parser("trade", help="seed, subscribe and run the scheduled playing jobs")
+    trade_parser.set_defaults(func=trade)
+
+    for command_parser in (seed_parser, export_parser, watch_parser, trade_parser):
+        command_parser.add_argument("--workers", type=int, default=1,
+                                    help="split the tournaments across this many worker processes")
+
+    return parser
+
 
-    # mm_instance.auto_playing() # Commented out to prevent infinite loops while testing
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile is not None:
+        import profiling
 
-    # Extract the event/market data to a format suitable for Sheets
-    data_to_write = extract_event_data_for_sheets(mm_instance)
+        profiling.configure(args.profile)
+    logging.info(f"running {args.command}")
+    return args.func(args)
 
-    # Print the data to verify its structure
-    # logging.info("Data to write to Google Sheets:")
-    # logging.info(data_to_write)
 
-    # Write the data to Google Sheets
-    logging.info("Writing data to Google Sheets...")
-    write_to_sheet(
-        SHEET_NAME, data_to_write
-    )  # Replace "Sheet1" with your actual sheet name
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+import asyncio         # Event loop, gather and semaphores
+import base64          # For decoding websocket payloads
+import inspect         # To accept both plain and async event handlers
+import json            # For working with JSON data
+import uuid            # For generating unique identifiers
+
+from urllib.parse import urljoin
+import aiohttp         # Async HTTP and websocket client
+import config
+from log import logging
+import constants
+from filters import IngestFilter
+import ratelimit
+
+PUSHER_PROTOCOL = 7
+
+
+class AsyncMMInteractions:
+    """
+    asyncio counterpart of mm_calls.MMInteractions. Every call is a coroutine that
+    shares one aiohttp session, so seeding, trading and exporting can interleave many
+    in-flight requests on a single event loop instead of a thread per task.
+
+    Usage:
+        async with AsyncMMInteractions() as mm:
+            await mm.mm_login()
+            await mm.seeding()
+    """
+
+    def __init__(self, mm_keys: dict = None, tournaments: list = None, max_in_flight: int = 64,
+                 ingest_filter: IngestFilter = None, budget: ratelimit.RequestBudget = None):
+        self.base_url = config.BASE_URL
+        self.mm_keys = mm_keys if mm_keys is not None else config.MM_KEYS
+        self.tournaments_interested = (tournaments if tournaments is not None
+                                       else config.TOURNAMENTS_INTERESTED)
+        self.balance = 0
+        self.mm_session = dict()
+        self.all_tournaments = dict()
+        self.my_tournaments = dict()
+        self.sport_events = dict()
+        self.wagers = dict()
+        self.valid_odds = []
+        self.ingest_filter = (ingest_filter if ingest_filter is not None
+                              else IngestFilter.from_config(config.INGEST_FILTERS))
+        self.budget = budget if budget is not None else ratelimit.shared_budget()
+        self._in_flight = asyncio.Semaphore(max_in_flight)  # Caps concurrent HTTP requests
+        self._http = None
+        self._websocket = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the websocket (if any) and the HTTP session.
+        """
+        if self._websocket is not None:
+            await self._websocket.close()
+            self._websocket = None
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self._http is None:
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    def _url(self, route: str) -> str:
+        return urljoin(self.base_url, config.URL[route])
+
+    def _get_auth_header(self) -> dict:
+        return {
+            'Authorization': f'Bearer {self.mm_session["access_token"]}',
+        }
+
+    async def _request(self, method: str, route: str, auth: bool = True, **kwargs):
+        """
+        Sends one request and returns (status, parsed JSON body or None).
+        """
+        if auth:
+            kwargs['headers'] = {**kwargs.get('headers', {}), **self._get_auth_header()}
+        await self.budget.acquire_async(ratelimit.route_priority(route))
+        async with self._in_flight:
+            async with self._session().request(method, self._url(route), **kwargs) as response:
+                self.budget.record(response.status)
+                try:
+                    body = await response.json(content_type=None)
+                except (aiohttp.ContentTypeError, json.JSONDecodeError):
+                    body = None
+                return response.status, body
+
+    async def mm_login(self) -> dict:
+        """
+        Logs into the MM API using the provided keys and saves the session details.
+        """
+        request_body = {
+            'access_key': self.mm_keys.get('access_key'),
+            'secret_key': self.mm_keys.get('secret_key'),
+        }
+        status, body = await self._request('POST', 'mm_login', auth=False, data=json.dumps(request_body))
+        if status != 200:
+            logging.debug("Please check your access key and secrete key to the user_info.json")
+            raise Exception("login failed")
+        self.mm_session = body['data']
+        logging.info("MM session started")
+        return self.mm_session
+
+    async def refresh_session(self) -> bool:
+        """
+        Exchanges the refresh token for a new access token.
+        """
+        status, body = await self._request('POST', 'mm_refresh',
+                                           json={'refresh_token': self.mm_session['refresh_token']})
+        if status != 200:
+            logging.info("Failed to call refresh endpoint")
+            return False
+        self.mm_session['access_token'] = body['data']['access_token']
+        return True
+
+    async def seeding(self):
+        """
+        Same flow as MMInteractions.seeding, but the odds ladder, tournaments and the
+        per-tournament events/markets requests all run concurrently.
+        """
+        logging.info("start seeding tournaments/events/markets")
+        (odds_status, odds_body), (t_status, t_body) = await asyncio.gather(
+            self._request('GET', 'mm_odds_ladder'),
+            self._request('GET', 'mm_tournaments'),
+        )
+        if odds_status != 200:
+            logging.info("not able to get valid odds from api, fall back to local constants")
+            self.valid_odds = constants.VALID_ODDS_BACKUP
+        else:
+            self.valid_odds = odds_body['data']
+        if t_status != 200:
+            raise Exception("not able to seed tournaments")
+        self.all_tournaments = (t_body or {}).get('data', {}).get('tournaments', {})
+
+        wanted = [one_t for one_t in self.all_tournaments if one_t['name'] in self.tournaments_interested]
+        for one_t in wanted:
+            self.my_tournaments[one_t['id']] = one_t
+        await asyncio.gather(*(self._seed_tournament(one_t) for one_t in wanted))
+
+        logging.info("Done, seeding")
+        logging.info(f"found {len(self.my_tournaments)} tournament, ingested {len(self.sport_events)} "
+                     f"sport events from {len(self.tournaments_interested)} tournaments")
+
+    async def _seed_tournament(self, one_t: dict):
+        status, body = await self._request('GET', 'mm_events', params={'tournament_id': one_t['id']})
+        if status != 200:
+            logging.info(f'skip tournament {one_t["name"]} as api request failed')
+            return
+        events = (body or {}).get('data', {}).get('sport_events')
+        if events is None:
+            return
+        events = [event for event in events if self.ingest_filter.accept_event(event)]
+        if not events:
+            return
+
+        event_ids = ','.join([str(event['event_id']) for event in events])
+        status, body = await self._request('GET', 'mm_multiple_markets', params={'event_ids': event_ids})
+        if status != 200:
+            logging.info(f'failed to get markets of events ids: {event_ids}')
+            return
+        map_market_by_event_id = (body or {}).get('data', {})
+        for event in events:
+            if str(event['event_id']) not in map_market_by_event_id:
+                continue
+            event['markets'] = map_market_by_event_id[str(event['event_id'])]
+            event.setdefault('tournament_name', one_t['name'])
+            event = self.ingest_filter.apply(event)
+            if event is None:
+                continue
+            self.sport_events[event['event_id']] = event
+
+    async def get_balance(self):
+        """
+        Fetches and logs the user's current balance.
+        """
+        status, body = await self._request('GET', 'mm_balance')
+        if status != 200:
+            logging.error("failed to get balance")
+            return
+        self.balance = body.get('data', {}).get('balance', 0)
+        logging.info(f"still have ${self.balance} left")
+        return self.balance
+
+    async def place_wager(self, line_id: str, odds: int, stake: float = 1.0):
+        """
+        Places a single wager and returns the wager id, or None on failure.
+        """
+        external_id = str(uuid.uuid1())
+        status, body = await self._request('POST', 'mm_place_wager', json={
+            'external_id': external_id,
+            'line_id': line_id,
+            'odds': odds,
+            'stake': stake,
+        })
+        if status != 200:
+            logging.info(f"failed to play, error {body}")
+            return None
+        wager_id = body.get('data', {})['wager']['id']
+        self.wagers[external_id] = wager_id
+        return wager_id
+
+    async def place_wagers(self, wagers: list) -> list:
+        """
+        Places a batch of wagers, each a dict with line_id, odds and stake.
+        Returns the succeeded wagers as reported by the API.
+        """
+        batch_body_to_send = [{'external_id': str(uuid.uuid1()), **wager} for wager in wagers]
+        status, body = await self._request('POST', 'mm_batch_place', json={'data': batch_body_to_send})
+        if status != 200:
+            logging.info(f"failed to play, error {body}")
+            return []
+        succeed_wagers = body['data']['succeed_wagers']
+        for wager in succeed_wagers:
+            self.wagers[wager['external_id']] = wager['id']
+        return succeed_wagers
+
+    async def cancel_wager(self, external_id: str) -> bool:
+        """
+        Cancels one wager placed by this client.
+        """
+        status, _ = await self._request('POST', 'mm_cancel_wager', json={
+            'external_id': external_id,
+            'wager_id': self.wagers[external_id],
+        })
+        if status == 200 or status == 404:
+            self.wagers.pop(external_id, None)
+            return True
+        logging.info("failed to cancel")
+        return False
+
+    async def cancel_wagers(self, external_ids: list) -> bool:
+        """
+        Cancels a batch of wagers placed by this client.
+        """
+        batch_cancel_body = [{'wager_id': self.wagers[x], 'external_id': x} for x in external_ids]
+        status, _ = await self._request('POST', 'mm_batch_cancel', json={'data': batch_cancel_body})
+        if status == 200 or status == 404:
+            for external_id in external_ids:
+                self.wagers.pop(external_id, None)
+            return True
+        logging.info("failed to cancel")
+        return False
+
+    async def cancel_all_wagers(self) -> bool:
+        """
+        Cancels all open wagers.
+        """
+        status, _ = await self._request('POST', 'mm_cancel_all_wagers', json={})
+        if status == 200 or status == 404:
+            self.wagers = dict()
+            return True
+        logging.info("failed to cancel")
+        return False
+
+    async def subscribe(self, public_handler=None, private_handler=None):
+        """
+        Connects to the Pusher websocket, subscribes to the broadcast and private
+        channels and dispatches events until the connection closes.
+
+        Handlers are called as handler(event_name, payload) with the base64 payload
+        already decoded to a dict; they may be plain functions or coroutines.
+        """
+        status, connection_config = await self._request('GET', 'websocket_config')
+        if status != 200:
+            logging.error("failed to get connection configs")
+            raise Exception("failed to get channels")
+        ws_url = (f"wss://ws-{connection_config['cluster']}.pusher.com/app/{connection_config['key']}"
+                  f"?protocol={PUSHER_PROTOCOL}&client=python")
+
+        handlers = dict()
+        async with self._session().ws_connect(ws_url, heartbeat=60) as websocket:
+            self._websocket = websocket
+            async for message in websocket:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                try:
+                    frame = json.loads(message.data)
+                except json.JSONDecodeError as e:
+                    logging.error(f"failed to decode websocket frame: {e}")
+                    continue
+                event_name = frame.get('event')
+                if event_name == 'pusher:connection_established':
+                    socket_id = json.loads(frame['data'])['socket_id']
+                    handlers = await self._subscribe_channels(websocket, socket_id,
+                                                              public_handler, private_handler)
+                elif event_name == 'pusher:ping':
+                    await websocket.send_json({'event': 'pusher:pong', 'data': {}})
+                elif event_name == 'pusher:error':
+                    logging.error(f"websocket error {frame.get('data')}")
+                elif (frame.get('channel'), event_name) in handlers:
+                    try:
+                        data = frame.get('data')
+                        data = json.loads(data) if isinstance(data, str) else (data or {})
+                        payload = json.loads(base64.b64decode(data.get('payload', '')) or '{}')
+                        result = handlers[(frame['channel'], event_name)](event_name, payload)
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as e:
+                        # Never let a malformed frame or a failing handler drop the websocket
+                        logging.error(f"failed to handle {event_name}: {e}")
+        self._websocket = None
+
+    async def _subscribe_channels(self, websocket, socket_id: str, public_handler, private_handler) -> dict:
+        """
+        Authorises and subscribes to the available channels, returning the
+        (channel, event name) -> handler map used for dispatching.
+        """
+        status, body = await self._request('POST', 'mm_auth', data={'socket_id': socket_id})
+        if status != 200:
+            logging.error("failed to get channels")
+            raise Exception("failed to get channels")
+        available_channels = (body or {}).get('data', {}).get('authorized_channel', [])
+
+        handlers = dict()
+        for channel in available_channels:
+            channel_name = channel['channel_name']
+            status, auth_body = await self._request('POST', 'mm_auth', headers={
+                'header-subscriptions': '''[{"type":"tournament","ids":[]}]''',
+            }, data={'socket_id': socket_id, 'channel_name': channel_name})
+            if status != 200:
+                logging.error(f"failed to authorise channel {channel_name}")
+                continue
+            await websocket.send_json({'event': 'pusher:subscribe',
+                                       'data': {'channel': channel_name, 'auth': auth_body.get('auth')}})
+
+            if 'broadcast' in channel_name:
+                for t_id in self.my_tournaments:
+                    event_name = f'tournament_{t_id}'
+                    handlers[(channel_name, event_name)] = public_handler or self._log_event
+                    logging.info(f"subscribed to public channel, event name: {event_name}, successfully")
+            else:
+                for private_event in channel['binding_events']:
+                    handlers[(channel_name, private_event['name'])] = private_handler or self._log_event
+                    logging.info(f"subscribed to private channel, event name: {private_event['name']}, successfully")
+        return handlers
+
+    @staticmethod
+    def _log_event(event_name: str, payload: dict):
+        logging.info("event %s details %s", event_name, payload, extra={'rate_key': event_name})
@@ -1,7 +1,6 @@
 import time            # Provides time-related functions, such as sleep
 import requests        # Allows us to send HTTP requests easily
 import json            # For working with JSON data
-import pysher          # A Python client for interacting with Pusher (WebSockets)
 import base64          # For encoding/decoding data in Base64 format
 import schedule        # Allows scheduling tasks at specific intervals
 import random          # For generating random numbers
@@ -12,22 +11,74 @@ from urllib.parse import urljoin  # Helps safely combine parts of URLs
 import config                     # Custom config file (likely storing constants, keys, etc.)
 from log import logging           # Custom log module for logging messages
 import constants                  # Another custom file storing constants
+import book                       # Helpers for walking/updating the sport_events book
+from filters import IngestFilter  # Market/event filters and projection applied at ingest time
+import ratelimit                  # Shared, priority-aware request budget
+from profiling import profiled    # Opt-in cProfile/tracemalloc reports per pipeline stage
+
+
+class _FramePayload:
+    """
+    The base64 payload of a websocket frame, decoded only if a log record that
+    carries it is actually formatted (rate-limited records never are).
+    """
+    __slots__ = ("frame",)
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def __str__(self):
+        return str(base64.b64decode(json.loads(self.frame).get('payload', '{}')))
+
 
 class MMInteractions:
-    base_url: str = None          # Base URL for the API
-    balance: float = 0            # User's current balance
-    mm_keys: dict = dict()        # Dictionary to store keys (access/secret) for authentication
-    mm_session: dict = dict()     # Dictionary to store session-related info (tokens)
-    all_tournaments: dict = dict()# Stores all tournaments from the API
-    my_tournaments: dict = dict() # Stores only the tournaments we are interested in
-    sport_events: dict = dict()   # Stores event details keyed by event_id, including markets
-    wagers: dict = dict()         # Stores placed wagers keyed by some unique identifier
-    valid_odds: list = []         # Stores valid odds retrieved from the API
+    base_url: str                 # Base URL for the API
+    balance: float                # User's current balance
+    mm_keys: dict                 # Dictionary to store keys (access/secret) for authentication
+    mm_session: dict              # Dictionary to store session-related info (tokens)
+    tournaments_interested: list  # Tournament names this instance seeds and subscribes to
+    all_tournaments: dict         # Stores all tournaments from the API
+    my_tournaments: dict          # Stores only the tournaments we are interested in
+    book: book.VersionedBook      # Event details keyed by event_id, including markets (copy-on-write)
+    wagers: dict                  # Stores placed wagers keyed by some unique identifier
+    valid_odds: list              # Stores valid odds retrieved from the API
+    change_feed = None            # Optional changefeed.OddsChangeFeed fed with every book update
+    ingest_filter: IngestFilter   # Drops/projects unwanted events and markets before they are stored
+    budget: ratelimit.RequestBudget  # Token bucket every request goes through
     pusher = None                 # Will hold the Pusher (WebSocket) connection object
 
-    def __init__(self):
-        self.base_url = config.BASE_URL      # Set the base URL from config
-        self.mm_keys = config.MM_KEYS        # Set the mm_keys (access/secret) from config
+    def __init__(self, mm_keys: dict = None, tournaments: list = None, change_feed=None,
+                 ingest_filter: IngestFilter = None, budget: ratelimit.RequestBudget = None):
+        """
+        All state lives on the instance, so several accounts or tournament shards
+        can run side by side in one process. Defaults come from config.
+        """
+        self.base_url = config.BASE_URL                                  # Set the base URL from config
+        self.mm_keys = mm_keys if mm_keys is not None else config.MM_KEYS # Set the mm_keys (access/secret)
+        self.tournaments_interested = (tournaments if tournaments is not None
+                                       else config.TOURNAMENTS_INTERESTED)
+        self.balance = 0
+        self.mm_session = dict()
+        self.all_tournaments = dict()
+        self.my_tournaments = dict()
+        self.book = book.VersionedBook()
+        self.wagers = dict()
+        self.valid_odds = []
+        self.pusher = None
+        self.change_feed = change_feed
+        self.ingest_filter = (ingest_filter if ingest_filter is not None
+                              else IngestFilter.from_config(config.INGEST_FILTERS))
+        self.budget = budget if budget is not None else ratelimit.shared_budget()
+        self.rng = None                        # numpy Generator, created on first start_playing
+        self.scheduler = schedule.Scheduler()  # Own scheduler, jobs are not shared between instances
+
+    @property
+    def sport_events(self) -> book.BookSnapshot:
+        """
+        Consistent, read-only snapshot of the book. Hold on to it for the duration of
+        a read (export, trading round); updates applied meanwhile go to newer versions.
+        """
+        return self.book.snapshot()
 
     def mm_login(self) -> dict:
         """
@@ -38,7 +89,7 @@ class MMInteractions:
             'access_key': self.mm_keys.get('access_key'),            # Include the access key
             'secret_key': self.mm_keys.get('secret_key'),            # Include the secret key
         }
-        response = requests.post(login_url, data=json.dumps(request_body)) # Send POST request to login
+        response = self._send('mm_login', 'POST', login_url, data=json.dumps(request_body)) # Send POST request to login
         if response.status_code != 200:                               # Check if login failed
             logging.debug(response)
             logging.debug("Please check your access key and secrete key to the user_info.json")
@@ -49,6 +100,7 @@ class MMInteractions:
         logging.info("MM session started")
         return mm_session
 
+    @profiled("seeding")
     def seeding(self):
         """
         This method:
@@ -58,7 +110,7 @@ class MMInteractions:
         """
         logging.info("start to get odds ladder")
         odds_ladder_url = urljoin(self.base_url, config.URL['mm_odds_ladder'])   # URL for odds ladder
-        odds_response = requests.get(odds_ladder_url, headers=self.__get_auth_header()) # GET request for odds
+        odds_response = self._send('mm_odds_ladder', 'GET', odds_ladder_url, headers=self.__get_auth_header()) # GET request for odds
         if odds_response.status_code != 200:      # If we can't get odds from the API
             logging.info("not able to get valid odds from api, fall back to local constants")
             self.valid_odds = constants.VALID_ODDS_BACKUP  # Use backup odds if API fails
@@ -68,7 +120,7 @@ class MMInteractions:
         logging.info("start seeding tournaments/events/markets")
         t_url = urljoin(self.base_url, config.URL['mm_tournaments'])  # URL for tournaments
         headers = self.__get_auth_header()                            # Authorization header
-        all_tournaments_response = requests.get(t_url, headers=headers) # GET all tournaments
+        all_tournaments_response = self._send('mm_tournaments', 'GET', t_url, headers=headers) # GET all tournaments
         if all_tournaments_response.status_code != 200:
             raise Exception("not able to seed tournaments")            # Stop if tournaments can't be retrieved
         all_tournaments = json.loads(all_tournaments_response.content).get('data', {}).get('tournaments', {})
@@ -80,31 +132,43 @@ class MMInteractions:
         # Loop through all tournaments returned
         for one_t in all_tournaments:
             # Check if tournament name is in the list we care about
-            if one_t['name'] in config.TOURNAMENTS_INTERESTED:
+            if one_t['name'] in self.tournaments_interested:
                 self.my_tournaments[one_t['id']] = one_t  # Add it to my_tournaments dictionary
-                events_response = requests.get(event_url, params={'tournament_id': one_t['id']}, headers=headers)
+                events_response = self._send('mm_events', 'GET', event_url, params={'tournament_id': one_t['id']}, headers=headers)
                 if events_response.status_code == 200:
                     events = json.loads(events_response.content).get('data', {}).get('sport_events')
                     #logging.info("printing events")
                     #print(events)
                     if events is None: # If no events for this tournament, continue to next
                         continue
+                    # Drop events outside the status/scheduled window before asking for their markets
+                    events = [event for event in events if self.ingest_filter.accept_event(event)]
+                    if not events:
+                        continue
 
                     # Collect event_ids to fetch their markets in one go
                     event_ids = ','.join([str(event['event_id']) for event in events])
-                    multiple_markets_response = requests.get(multiple_markets_url, params={'event_ids': event_ids},
-                                                             headers=headers)
+                    multiple_markets_response = self._send('mm_multiple_markets', 'GET', multiple_markets_url,
+                                                           params={'event_ids': event_ids}, headers=headers)
                     if multiple_markets_response.status_code == 200:
                         # Get a dictionary mapping event_id to their market data
                         map_market_by_event_id = json.loads(multiple_markets_response.content).get('data', {})
+                        seeded = dict()  # Published to the book in one version per tournament
                         for event in events:
                             # Ensure that we have market info for this event
                             if str(event['event_id']) not in map_market_by_event_id:
                                 continue
                             event['markets'] = map_market_by_event_id[str(event['event_id'])] # Attach markets to event
-                            self.sport_events[event['event_id']] = event                     # Store the full event data
-                            logging.info(f'successfully get markets of events {event["name"]}')
-                            #print(self.sport_events)
+                            event.setdefault('tournament_name', one_t['name'])              # Used to partition exports
+                            event = self.ingest_filter.apply(event)                          # Filter/project markets
+                            if event is None:
+                                continue
+                            seeded[event['event_id']] = event                                # Store the full event data
+                            logging.info(f'successfully get markets of events {event["name"]}',
+                                         extra={'rate_key': 'seeding'})
+                        self.book.put_many(seeded)
+                        if self.change_feed is not None:
+                            self.change_feed.observe_book(seeded)
                     else:
                         logging.info(f'failed to get markets of events ids: {",".join([str(event["event_id"]) for event in events])}')
                 else:
@@ -112,16 +176,16 @@ class MMInteractions:
 
         logging.info("Done, seeding")
         logging.info(f"found {len(self.my_tournaments)} tournament, ingested {len(self.sport_events)} "
-                     f"sport events from {len(config.TOURNAMENTS_INTERESTED)} tournaments")
+                     f"sport events from {len(self.tournaments_interested)} tournaments")
 
     def _get_channels(self, socket_id: float):
         """
         Retrieves authorized channels (public/private) for this user.
         """
         auth_endpoint_url = urljoin(self.base_url, config.URL['mm_auth'])   # URL for auth endpoint
-        channels_response = requests.post(auth_endpoint_url,
-                                          data={'socket_id': socket_id},
-                                          headers=self.__get_auth_header())
+        channels_response = self._send('mm_auth', 'POST', auth_endpoint_url,
+                                       data={'socket_id': socket_id},
+                                       headers=self.__get_auth_header())
         if channels_response.status_code != 200:
             logging.error("failed to get channels")
             raise Exception("failed to get channels")
@@ -133,7 +197,7 @@ class MMInteractions:
         Gets configuration settings for connecting to the Pusher WebSocket service.
         """
         connection_config_url = urljoin(self.base_url, config.URL['websocket_config']) # URL for websocket config
-        connection_response = requests.get(connection_config_url, headers=self.__get_auth_header())
+        connection_response = self._send('websocket_config', 'GET', connection_config_url, headers=self.__get_auth_header())
         if connection_response.status_code != 200:
             logging.error("failed to get connection configs")
             raise Exception("failed to get channels")
@@ -146,6 +210,8 @@ class MMInteractions:
         2. Connect to Pusher WebSocket using our credentials.
         3. On successful connection, subscribe to channels and events we are interested in.
         """
+        import pysher  # Imported here so commands without a websocket skip loading it
+
         connection_config = self._get_connection_config()  # Get pusher configs
         key = connection_config['key']
         cluster = connection_config['cluster']
@@ -161,17 +227,22 @@ class MMInteractions:
                                     auth_endpoint=auth_endpoint_url,
                                     auth_endpoint_headers=auth_headers)
 
+        @profiled("ws_public", aggregate=True)
         def public_event_handler(*args, **kwargs):
             # Handler for events from public channels
-            print("processing public, Args:", args)
-            print(f"event details {base64.b64decode(json.loads(args[0]).get('payload', '{}'))}")
-            print("processing public, Kwargs:", kwargs)
-
+            payload = base64.b64decode(json.loads(args[0]).get('payload', '{}'))
+            logging.info("processing public, event details %s", payload, extra={'rate_key': 'ws_public'})
+            try:
+                self.apply_update(json.loads(payload or '{}'))
+            except Exception as e:
+                # Never let a malformed frame kill the websocket thread
+                logging.error(f"failed to apply update: {e}")
+
+        @profiled("ws_private", aggregate=True)
         def private_event_handler(*args, **kwargs):
             # Handler for events from private channels
-            print("processing private, Args:", args)
-            print(f"event details {base64.b64decode(json.loads(args[0]).get('payload', '{}'))}")
-            print("processing private, Kwargs:", kwargs)
+            logging.info("processing private, event details %s", _FramePayload(args[0]),
+                         extra={'rate_key': 'ws_private'})
 
         def connect_handler(data):
             # This runs once connection is established
@@ -207,12 +278,23 @@ class MMInteractions:
         self.pusher.connection.bind('pusher:connection_established', connect_handler)
         self.pusher.connect()  # Initiate the connection
 
+    def apply_update(self, payload: dict):
+        """
+        Applies a decoded websocket payload to sport_events and feeds the touched
+        event (or its removal) to the change feed, if one is attached.
+        """
+        event_id = self.book.apply_update(self.ingest_filter.filter_update(payload))
+        if event_id is not None and self.change_feed is not None:
+            # None when the update removed the event, so its selections are reported as removed
+            self.change_feed.observe_event(event_id, self.book.snapshot().get(event_id))
+        return event_id
+
     def get_balance(self):
         """
         Fetches and logs the user's current balance.
         """
         balance_url = urljoin(self.base_url, config.URL['mm_balance'])
-        response = requests.get(balance_url, headers=self.__get_auth_header())
+        response = self._send('mm_balance', 'GET', balance_url, headers=self.__get_auth_header())
         if response.status_code != 200:
             logging.error("failed to get balance")
             return
@@ -221,63 +303,43 @@ class MMInteractions:
 
     def start_playing(self):
         """
-        Example function showing how to place wagers (both single and batch).
+        Example function showing how to place wagers in batches.
         Randomly decides when and how to place bets on events' moneyline markets.
+
+        Candidate selection, odds and stakes are computed for the whole book at once
+        on NumPy arrays (see pricing.py); only the batch requests are sent one by one.
         """
+        import pricing  # NumPy is only loaded by commands that trade
+
+        if self.budget.stats()['waiting'] > 0:
+            # Requests are already queued on the budget, skip this round rather than pile on
+            logging.info("request budget busy, skip playing this round")
+            return
         logging.info("Start playing, randomly :)")
-        play_url = urljoin(self.base_url, config.URL['mm_place_wager'])
         batch_play_url = urljoin(self.base_url, config.URL['mm_batch_place'])
-        if '.prophetx.co' in play_url:
+        if '.prophetx.co' in batch_play_url:
             # Safety check: do not run in production
             raise Exception("only allowed to run in non production environment")
 
-        # Loop through all sport events
-        for key in self.sport_events:
-            one_event = self.sport_events[key]
-            # Look for markets in the event
-            for market in one_event.get('markets', []):
-                if market['type'] == 'moneyline':
-                    # We only consider moneyline bets here
-                    if random.random() < 0.3: # 30% chance to consider this event
-                        for selection in market.get('selections', []):
-                            if random.random() < 0.3: # 30% chance to choose this selection
-                                odds_to_play = self.__get_random_odds()
-                                external_id = str(uuid.uuid1())  # Unique ID for the wager
-                                logging.info(f"going to play on '{one_event['name']}' on moneyline, side {selection[0]['name']} with odds {odds_to_play}")
-                                body_to_send = {
-                                    'external_id': external_id,
-                                    'line_id': selection[0]['line_id'],
-                                    'odds': odds_to_play,
-                                    'stake': 1.0
-                                }
-                                # Place single wager
-                                play_response = requests.post(play_url, json=body_to_send,
-                                                              headers=self.__get_auth_header())
-                                if play_response.status_code != 200:
-                                    logging.info(f"failed to play, error {play_response.content}")
-                                else:
-                                    logging.info("successfully")
-                                    # Store this wager ID
-                                    self.wagers[external_id] = json.loads(play_response.content).get('data', {})['wager']['id']
-
-                                # Test batch wager placement
-                                batch_n = 3  # Place 3 wagers at once
-                                external_id_batch = [str(uuid.uuid1()) for x in range(batch_n)]
-                                batch_body_to_send = [{
-                                    'external_id': external_id_batch[x],
-                                    'line_id': selection[0]['line_id'],
-                                    'odds': odds_to_play,
-                                    'stake': 1.0
-                                } for x in range(batch_n)]
-                                batch_play_response = requests.post(batch_play_url, json={"data": batch_body_to_send},
-                                                                     headers=self.__get_auth_header())
-                                if batch_play_response.status_code != 200:
-                                    logging.info(f"failed to play, error {play_response.content}")
-                                else:
-                                    logging.info("successfully")
-                                    # Store all newly placed wagers
-                                    for wager in batch_play_response.json()['data']['succeed_wagers']:
-                                        self.wagers[wager['external_id']] = wager['id']
+        if self.rng is None:
+            self.rng = pricing.np.random.default_rng()
+        candidates = pricing.moneyline_candidates(self.sport_events)
+        plan = pricing.plan_wagers(candidates, self.valid_odds, rng=self.rng)
+        external_ids = [str(uuid.uuid1()) for _ in range(len(plan['line_ids']))]  # Unique ID per wager
+        for label, odds_to_play in zip(plan['labels'], plan['odds']):
+            logging.info(f"going to play on '{label}' on moneyline with odds {odds_to_play}",
+                         extra={'rate_key': 'playing'})
+
+        for batch_body_to_send in pricing.batch_payloads(plan, external_ids):
+            batch_play_response = self._send('mm_batch_place', 'POST', batch_play_url, json=batch_body_to_send,
+                                              headers=self.__get_auth_header())
+            if batch_play_response.status_code != 200:
+                logging.info(f"failed to play, error {batch_play_response.content}")
+            else:
+                logging.info("successfully")
+                # Store all newly placed wagers
+                for wager in batch_play_response.json()['data']['succeed_wagers']:
+                    self.wagers[wager['external_id']] = wager['id']
 
     def cancel_all_wagers(self):
         """
@@ -286,7 +348,7 @@ class MMInteractions:
         logging.info("CANCELLING ALL WAGERS")
         cancel_all_url = urljoin(self.base_url, config.URL['mm_cancel_all_wagers'])
         body = {}
-        response = requests.post(cancel_all_url, json=body, headers=self.__get_auth_header())
+        response = self._send('mm_cancel_all_wagers', 'POST', cancel_all_url, json=body, headers=self.__get_auth_header())
         if response.status_code != 200:
             if response.status_code == 404:
                 logging.info("already cancelled")
@@ -312,7 +374,7 @@ class MMInteractions:
                     'external_id': key,
                     'wager_id': wager_id,
                 }
-                response = requests.post(cancel_url, json=body, headers=self.__get_auth_header())
+                response = self._send('mm_cancel_wager', 'POST', cancel_url, json=body, headers=self.__get_auth_header())
                 if response.status_code != 200:
                     if response.status_code == 404:
                         logging.info("already cancelled")
@@ -334,7 +396,8 @@ class MMInteractions:
         batch_cancel_body = [{'wager_id': self.wagers[x],
                               'external_id': x} for x in batch_keys_to_cancel]
         batch_cancel_url = urljoin(self.base_url, config.URL['mm_batch_cancel'])
-        response = requests.post(batch_cancel_url, json={'data': batch_cancel_body}, headers=self.__get_auth_header())
+        response = self._send('mm_batch_cancel', 'POST', batch_cancel_url, json={'data': batch_cancel_body},
+                              headers=self.__get_auth_header())
         if response.status_code != 200:
             if response.status_code == 404:
                 logging.info("already cancelled")
@@ -347,14 +410,14 @@ class MMInteractions:
                 try:
                     self.wagers.pop(key)
                 except Exception as e:
-                    print(e)
+                    logging.error(e)
 
     def __run_forever_in_thread(self):
         """
         Runs the scheduled tasks forever in a separate thread.
         """
         while True:
-            schedule.run_pending() # Check if any scheduled task is due and run it
+            self.scheduler.run_pending() # Check if any scheduled task is due and run it
             time.sleep(1)          # Wait 1 second before checking again
 
     def __auto_extend_session(self):
@@ -362,8 +425,9 @@ class MMInteractions:
         Automatically refreshes the session token before it expires and reconnects the WebSocket.
         """
         refresh_url = urljoin(self.base_url, config.URL['mm_refresh'])
-        response = requests.post(refresh_url, json={'refresh_token': self.mm_session['refresh_token']},
-                                 headers=self.__get_auth_header())
+        response = self._send('mm_refresh', 'POST', refresh_url,
+                              json={'refresh_token': self.mm_session['refresh_token']},
+                              headers=self.__get_auth_header())
         if response.status_code != 200:
             logging.info("Failed to call refresh endpoint")
         else:
@@ -374,6 +438,13 @@ class MMInteractions:
                 self.pusher = None
             self.subscribe() # Re-subscribe to channels with new token
 
+    def schedule_session_refresh(self):
+        """
+        Refreshes the session (and reconnects the websocket) every 8 minutes while
+        the scheduler thread runs.
+        """
+        self.scheduler.every(8).minutes.do(self.__auto_extend_session)
+
     def auto_playing(self):
         """
         Schedules several tasks to run periodically:
@@ -381,13 +452,15 @@ class MMInteractions:
         - Randomly cancel wagers every 9 seconds
         - Randomly cancel a batch of wagers every 7 seconds
         - Refresh session every 8 minutes
+        - Log the request budget spend every minute
         """
         logging.info("schedule to play every 10 seconds!")
-        schedule.every(10).seconds.do(self.start_playing)
-        schedule.every(9).seconds.do(self.random_cancel_wager)
-        schedule.every(7).seconds.do(self.random_batch_cancel_wagers)
-        schedule.every(8).minutes.do(self.__auto_extend_session)
-        # schedule.every(60).seconds.do(self.cancel_all_wagers) # Example commented out
+        self.scheduler.every(10).seconds.do(self.start_playing)
+        self.scheduler.every(9).seconds.do(self.random_cancel_wager)
+        self.scheduler.every(7).seconds.do(self.random_batch_cancel_wagers)
+        self.schedule_session_refresh()
+        self.scheduler.every(1).minutes.do(lambda: logging.info(f"request budget {self.budget.stats()}"))
+        # self.scheduler.every(60).seconds.do(self.cancel_all_wagers) # Example commented out
 
         child_thread = threading.Thread(target=self.__run_forever_in_thread, daemon=False)
         child_thread.start()  # Start the thread that runs these scheduled tasks
@@ -399,6 +472,19 @@ class MMInteractions:
         child_thread = threading.Thread(target=self.__run_forever_in_thread, daemon=False)
         child_thread.start()
 
+    def _send(self, route: str, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends one request to a config.URL route through the shared request budget, at
+        the route's priority (ratelimit.ROUTE_PRIORITY), so cancels and refresh go
+        before placement and placement before seeding, and feeds the status back.
+        """
+        self.budget.acquire(ratelimit.route_priority(route))
+        response = requests.request(method, url, **kwargs)
+        self.budget.record(response.status_code)
+        if response.status_code == 429:
+            logging.info(f"throttled by the api, budget now {self.budget.stats()}", extra={'rate_key': 'throttled'})
+        return response
+
     def __get_auth_header(self) -> dict:
         """
         Constructs the authorization header needed for API requests using the current access token.
@@ -406,13 +492,3 @@ class MMInteractions:
         return {
             'Authorization': f'Bearer {self.mm_session["access_token"]}',
         }
-
-    def __get_random_odds(self):
-        """
-        Picks a random odds value from the valid odds list, sometimes negating it, and ensures it never stays at -100.
-        """
-        odds = self.valid_odds[random.randint(0, len(self.valid_odds) - 1)] # Pick a random odds from list
-        odds = odds if random.random() < 0.5 else -1 * odds                 # 50% chance to flip sign
-        if odds == -100:
-            odds = 100   # Avoid having exactly -100 odds
-        return odds
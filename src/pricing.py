@@ -0,0 +1,80 @@
+import numpy as np
+
+# Market statuses that can not take wagers
+CLOSED_MARKET_STATUSES = ('suspended', 'closed', 'settled', 'cancelled', 'inactive')
+
+
+def moneyline_candidates(sport_events: dict) -> dict:
+    """
+    Array view of every open moneyline selection in the book.
+
+    Returns parallel arrays, one entry per selection:
+        line_ids       line_id of the selection
+        market_index   index of the market the selection belongs to, so random
+                       choices can be drawn per market and broadcast to selections
+        labels         "<event name> / <selection name>" for logging
+    plus n_markets.
+    """
+    line_ids, market_index, labels = [], [], []
+    n_markets = 0
+    for one_event in sport_events.values():
+        for market in one_event.get('markets', []):
+            if market.get('type') != 'moneyline' or market.get('status') in CLOSED_MARKET_STATUSES:
+                continue
+            for selection in market.get('selections', []):
+                if not selection:
+                    continue
+                line_ids.append(selection[0]['line_id'])
+                market_index.append(n_markets)
+                labels.append(f"{one_event.get('name')} / {selection[0].get('name')}")
+            n_markets += 1
+    return {
+        'line_ids': np.asarray(line_ids, dtype=object),
+        'market_index': np.asarray(market_index, dtype=np.int64),
+        'labels': np.asarray(labels, dtype=object),
+        'n_markets': n_markets,
+    }
+
+
+def plan_wagers(candidates: dict, valid_odds: list, rng: np.random.Generator = None,
+                market_probability: float = 0.3, selection_probability: float = 0.3,
+                stake: float = 1.0, copies: int = 4) -> dict:
+    """
+    Picks selections and prices them in one vectorized pass, with the same rules
+    start_playing used per selection: each market is considered with
+    market_probability, each of its selections with selection_probability, the odds
+    are a random ladder value with a random sign (-100 becomes 100), and every chosen
+    selection is played `copies` times at the same stake.
+
+    Returns arrays line_ids, odds and labels, one entry per wager to place, and the stake.
+    """
+    rng = rng or np.random.default_rng()
+    ladder = np.asarray(valid_odds, dtype=np.int64)
+
+    market_chosen = rng.random(candidates['n_markets']) < market_probability
+    chosen = market_chosen[candidates['market_index']] & (rng.random(len(candidates['line_ids'])) < selection_probability)
+    chosen_index = np.flatnonzero(chosen)
+
+    odds = ladder[rng.integers(0, len(ladder), size=len(chosen_index))]
+    odds = np.where(rng.random(len(chosen_index)) < 0.5, odds, -odds)
+    odds = np.where(odds == -100, 100, odds)
+
+    return {
+        'line_ids': np.repeat(candidates['line_ids'][chosen_index], copies),
+        'odds': np.repeat(odds, copies),
+        'labels': np.repeat(candidates['labels'][chosen_index], copies),
+        'stake': float(stake),
+    }
+
+
+def batch_payloads(plan: dict, external_ids: list, batch_size: int = 50) -> list:
+    """
+    Splits a plan into ready-to-send place_multiple_wagers bodies.
+    """
+    wagers = [{
+        'external_id': external_id,
+        'line_id': line_id,
+        'odds': int(odds),
+        'stake': plan['stake'],
+    } for external_id, line_id, odds in zip(external_ids, plan['line_ids'], plan['odds'])]
+    return [{'data': wagers[i:i + batch_size]} for i in range(0, len(wagers), batch_size)]
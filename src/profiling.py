@@ -0,0 +1,190 @@
+import atexit
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from log import LOG_DIR, logging
+
+# Opt-in profiling, e.g. MM_PROFILE=cpu,mem or main.py --profile cpu,mem
+#   cpu          cProfile, report sorted by cumulative time
+#   pyinstrument pyinstrument call tree (falls back to cpu if it is not installed)
+#   mem          tracemalloc, top allocation growth and peak per stage
+PROFILE_MODES = set()
+PROFILE_DIR = os.path.join(LOG_DIR, "profile")
+PROFILE_EVERY = int(os.getenv("MM_PROFILE_EVERY", 1000))  # Calls per report for aggregated stages
+TOP_N = 40
+
+
+def configure(modes: str):
+    """
+    Sets the profiling modes from a comma separated string. Also exported to the
+    environment, so spawned worker processes profile the same way.
+    """
+    PROFILE_MODES.clear()
+    PROFILE_MODES.update(mode.strip().lower() for mode in (modes or "").split(",") if mode.strip())
+    os.environ["MM_PROFILE"] = ",".join(sorted(PROFILE_MODES))
+    if PROFILE_MODES:
+        logging.info(f"profiling enabled: {', '.join(sorted(PROFILE_MODES))}, reports in {PROFILE_DIR}")
+
+
+def _report_path(stage: str, suffix: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.{suffix}")
+
+
+def _write_cpu_report(stage: str, profiler: cProfile.Profile):
+    profiler.dump_stats(_report_path(stage, "prof"))
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(TOP_N)
+    with open(_report_path(stage, "cpu.txt"), "w") as fp:
+        fp.write(stream.getvalue())
+
+
+def _write_mem_report(stage: str, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot):
+    current, peak = tracemalloc.get_traced_memory()
+    with open(_report_path(stage, "mem.txt"), "w") as fp:
+        fp.write(f"traced memory: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n\n")
+        stats = after.compare_to(before, "lineno") if before is not None else after.statistics("lineno")
+        for stat in stats[:TOP_N]:
+            fp.write(f"{stat}\n")
+
+
+def _cpu_modes() -> tuple:
+    """
+    (use pyinstrument, use cProfile) for the current modes.
+    """
+    if "pyinstrument" in PROFILE_MODES:
+        try:
+            import pyinstrument  # noqa: F401
+            return True, False
+        except ImportError:
+            logging.info("pyinstrument is not installed, falling back to cProfile")
+            return False, True
+    return False, "cpu" in PROFILE_MODES
+
+
+def _profile_call(stage: str, func, args, kwargs):
+    use_pyinstrument, use_cprofile = _cpu_modes()
+    use_mem = "mem" in PROFILE_MODES
+
+    before = None
+    if use_mem:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+    if use_pyinstrument:
+        import pyinstrument
+        profiler = pyinstrument.Profiler()
+    elif use_cprofile:
+        profiler = cProfile.Profile()
+    else:
+        profiler = None
+
+    started = time.perf_counter()
+    if use_pyinstrument:
+        profiler.start()
+    elif use_cprofile:
+        profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if use_pyinstrument:
+            profiler.stop()
+        elif use_cprofile:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+        if use_pyinstrument:
+            with open(_report_path(stage, "pyinstrument.txt"), "w") as fp:
+                fp.write(profiler.output_text(unicode=True))
+        elif use_cprofile:
+            _write_cpu_report(stage, profiler)
+        if use_mem:
+            _write_mem_report(stage, before, tracemalloc.take_snapshot())
+        logging.info(f"profiled {stage} in {elapsed:.3f}s")
+
+
+class _Aggregate:
+    """
+    Accumulates one cProfile across many short calls (e.g. websocket frames) and
+    writes a report every PROFILE_EVERY calls and at exit.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.calls = 0
+        self.profiler = cProfile.Profile()
+        self.before = None
+        self.lock = threading.Lock()
+        atexit.register(self.report)
+
+    def call(self, func, args, kwargs):
+        with self.lock:
+            if "mem" in PROFILE_MODES and self.before is None:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                self.before = tracemalloc.take_snapshot()
+            use_cprofile = bool(PROFILE_MODES & {"cpu", "pyinstrument"})
+            if use_cprofile:
+                self.profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if use_cprofile:
+                    self.profiler.disable()
+                self.calls += 1
+                if self.calls % PROFILE_EVERY == 0:
+                    self._report_locked()
+
+    def report(self):
+        with self.lock:
+            self._report_locked()
+
+    def _report_locked(self):
+        if self.calls == 0:
+            return
+        if PROFILE_MODES & {"cpu", "pyinstrument"}:
+            _write_cpu_report(self.stage, self.profiler)
+        if "mem" in PROFILE_MODES and self.before is not None:
+            _write_mem_report(self.stage, self.before, tracemalloc.take_snapshot())
+        logging.info(f"profiled {self.calls} calls of {self.stage}")
+
+
+_aggregates = dict()  # stage -> _Aggregate, one per stage for the whole process
+_aggregates_lock = threading.Lock()
+
+
+def _aggregate(stage: str) -> _Aggregate:
+    with _aggregates_lock:
+        if stage not in _aggregates:
+            _aggregates[stage] = _Aggregate(stage)
+        return _aggregates[stage]
+
+
+def profiled(stage: str, aggregate: bool = False):
+    """
+    Decorator that profiles every call of a pipeline stage when profiling is enabled
+    and is a plain pass-through otherwise. With aggregate=True, calls are accumulated
+    into one report per stage instead of one report per call, however many times
+    the decorated function is redefined (e.g. websocket handlers on resubscribe).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_MODES:
+                return func(*args, **kwargs)
+            if aggregate:
+                return _aggregate(stage).call(func, args, kwargs)
+            return _profile_call(stage, func, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+configure(os.getenv("MM_PROFILE", ""))
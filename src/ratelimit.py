@@ -0,0 +1,222 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+# Request priorities, lower is served first
+PRIORITY_CANCEL = 0    # Cancels, session refresh/login and websocket auth
+PRIORITY_PLACE = 1     # Wager placement and balance
+PRIORITY_SEED = 2      # Seeding tournaments/events/markets
+
+PRIORITY_NAMES = {PRIORITY_CANCEL: "cancel", PRIORITY_PLACE: "place", PRIORITY_SEED: "seed"}
+
+# Priority of each config.URL route
+ROUTE_PRIORITY = {
+    "mm_login": PRIORITY_CANCEL,
+    "mm_refresh": PRIORITY_CANCEL,
+    "mm_auth": PRIORITY_CANCEL,
+    "websocket_config": PRIORITY_CANCEL,
+    "mm_cancel_wager": PRIORITY_CANCEL,
+    "mm_batch_cancel": PRIORITY_CANCEL,
+    "mm_cancel_all_wagers": PRIORITY_CANCEL,
+    "mm_place_wager": PRIORITY_PLACE,
+    "mm_batch_place": PRIORITY_PLACE,
+    "mm_balance": PRIORITY_PLACE,
+}
+
+
+
+def route_priority(route: str) -> int:
+    """
+    The priority of a config.URL route; routes not listed are seeding.
+    """
+    return ROUTE_PRIORITY.get(route, PRIORITY_SEED)
+
+
+# Budget settings, overridable from the environment
+MM_RATE_LIMIT = float(os.getenv("MM_RATE_LIMIT", 10))          # Starting requests/second
+MM_RATE_LIMIT_MAX = float(os.getenv("MM_RATE_LIMIT_MAX", 20))  # Ceiling the rate may grow back to
+MM_RATE_LIMIT_MIN = float(os.getenv("MM_RATE_LIMIT_MIN", 1))   # Floor after repeated 429s
+
+
+class RequestBudget:
+    """
+    Priority-aware token bucket shared by every MM API call of a process.
+
+    Tokens refill at `rate` per second up to `burst`. Callers, threads and asyncio
+    tasks alike, wait in one queue in priority order, so queued cancels and
+    refreshes always go before placement, and placement before seeding. The rate adapts: a 429 halves it (down to min_rate) and empties
+    the bucket, while each success raises it a little (up to max_rate), so the
+    budget settles just under the highest rate the API accepts.
+    """
+
+    def __init__(self, rate: float = MM_RATE_LIMIT, burst: float = None,
+                 min_rate: float = MM_RATE_LIMIT_MIN, max_rate: float = MM_RATE_LIMIT_MAX,
+                 increase: float = 0.05):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.increase = increase
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._waiting = []                 # Heap of (priority, ticket)
+        self._async_wakers = dict()        # (priority, ticket) -> (loop, future) of a sleeping asyncio waiter
+        self._tickets = itertools.count()
+        self._spent = {priority: 0 for priority in PRIORITY_NAMES}
+        self._throttled = 0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _grant(self, priority: int):
+        self._tokens -= 1
+        self._spent[priority] = self._spent.get(priority, 0) + 1
+
+    def _leave_queue(self, entry: tuple):
+        """
+        Removes a waiter that was granted or gave up and wakes the new head: threads
+        through the condition, an asyncio waiter through its future.
+        """
+        if self._waiting and self._waiting[0] == entry:
+            heapq.heappop(self._waiting)
+        elif entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+        self._cond.notify_all()
+        if self._waiting and self._waiting[0] in self._async_wakers:
+            loop, waker = self._async_wakers[self._waiting[0]]
+            loop.call_soon_threadsafe(_resolve, waker)
+
+    def acquire(self, priority: int, timeout: float = None) -> bool:
+        """
+        Blocks until a token is granted to this caller, after every queued caller of
+        higher (lower number) or equal priority that came first. Returns False if
+        timeout elapsed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            entry = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    self._refill()
+                    at_head = self._waiting[0] == entry
+                    if at_head and self._tokens >= 1:
+                        self._grant(priority)
+                        return True
+                    # The head sleeps until its token is due, the rest until the head moves
+                    wait = (1 - self._tokens) / self.rate if at_head else None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._leave_queue(entry)
+
+    def try_acquire(self, priority: int) -> float:
+        """
+        Takes a token without waiting if one is free and no higher priority caller is
+        queued. Returns 0 when granted, else the seconds worth waiting before retrying.
+        """
+        with self._cond:
+            self._refill()
+            if self._waiting and self._waiting[0][0] < priority:
+                return 1 / self.rate
+            if self._tokens >= 1:
+                self._grant(priority)
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire_async(self, priority: int):
+        """
+        asyncio flavour of acquire. The task queues with the threads by (priority,
+        ticket) and sleeps on the event loop until its token is due, if it is at the
+        head of the queue, or until the waiter ahead of it leaves the queue.
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            entry = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, entry)
+        try:
+            while True:
+                with self._cond:
+                    self._refill()
+                    at_head = self._waiting[0] == entry
+                    if at_head and self._tokens >= 1:
+                        self._grant(priority)
+                        return
+                    wait = (1 - self._tokens) / self.rate if at_head else None
+                    waker = loop.create_future()
+                    self._async_wakers[entry] = (loop, waker)
+                try:
+                    await asyncio.wait((waker,), timeout=wait)
+                finally:
+                    with self._cond:
+                        self._async_wakers.pop(entry, None)
+        finally:
+            with self._cond:
+                self._leave_queue(entry)
+
+    def record(self, status_code: int):
+        """
+        Feeds a response status back into the adaptive rate.
+        """
+        with self._cond:
+            if status_code == 429:
+                self._throttled += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = min(self._tokens, 0)
+            elif status_code < 500:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def stats(self) -> dict:
+        """
+        Current rate, tokens, queue length, 429 count and requests spent per priority.
+        """
+        with self._cond:
+            self._refill()
+            return {
+                "rate": round(self.rate, 3),
+                "tokens": round(self._tokens, 3),
+                "waiting": len(self._waiting),
+                "throttled": self._throttled,
+                "spent": {PRIORITY_NAMES.get(priority, priority): spent for priority, spent in self._spent.items()},
+            }
+
+
+def _resolve(waker: asyncio.Future):
+    if not waker.done():
+        waker.set_result(None)
+
+
+_shared_budget = None
+_shared_budget_lock = threading.Lock()
+
+
+def shared_budget() -> RequestBudget:
+    """
+    The process-wide budget used by every MM client that is not given its own.
+    """
+    global _shared_budget
+    with _shared_budget_lock:
+        if _shared_budget is None:
+            _shared_budget = RequestBudget()
+        return _shared_budget
+
+
+def budget_share(shares: int) -> RequestBudget:
+    """
+    A budget holding 1/shares of the configured rates, for one of `shares` worker
+    processes that log in with the same account and so share its API limit.
+    """
+    shares = max(1, shares)
+    return RequestBudget(rate=MM_RATE_LIMIT / shares, min_rate=MM_RATE_LIMIT_MIN / shares,
+                         max_rate=MM_RATE_LIMIT_MAX / shares)
@@ -0,0 +1,188 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from log import logging
+from profiling import profiled
+from config import SERVICE_ACCOUNT_FILE, SPREADSHEET_ID
+import pytz
+
+
+# Scope for Sheets API access
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+
+@lru_cache(maxsize=None)
+def get_service():
+    """
+    Authenticates with the service account and builds the Sheets client on first use.
+    The Google libraries are imported here so that commands which never touch
+    Sheets do not pay for auth or discovery-document building.
+    """
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+
+    credentials = service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, scopes=SCOPES
+    )
+    return build("sheets", "v4", credentials=credentials)
+
+
+@profiled("write_to_sheet")
+def append_rows(sheet_name, data):
+    """
+    Appends rows to a sheet. API errors are raised to the caller.
+    """
+    get_service().spreadsheets().values().append(
+        spreadsheetId=SPREADSHEET_ID,
+        range=sheet_name + "!A1",
+        body={"values": data},
+        valueInputOption="RAW",
+    ).execute()
+
+
+# Google Sheets function to write data
+def write_to_sheet(sheet_name, data):
+    from googleapiclient.errors import HttpError
+
+    try:
+        # Write data to Google Sheets
+        append_rows(sheet_name, data)
+        logging.info(f"Successfully wrote data to {sheet_name}")
+    except HttpError as err:
+        logging.error(f"Error occurred while writing to Google Sheets: {err}")
+
+
+# Columns of the exported sheet, one row per selection
+HEADER = [
+    "Event ID",
+    "Event Scheduled Time",
+    "Event Name",
+    "Event Competitor 1",
+    "Event Competitor 1 Abbreviation",
+    "Event Competitor 1 Side",
+    "Event Competitor 2",
+    "Event Competitor 2 Abbreviation",
+    "Event Competitor 2 Side",
+    "Market ID",
+    "Market Name",
+    "Market Type",
+    "Market Status",
+    "Market Line ID",
+    "Market Line Name",
+    "Market Line",
+    "Market Line Favourite",
+    "Market Line Type",
+    "Selection ID",
+    "Selection Name",
+    "Selection Odds",
+    "Event Status",
+    "Selection Stake",
+    "Selection Value",
+    "Market Updated",
+]
+
+LINE_ID_COLUMN = HEADER.index("Selection ID")
+
+
+def event_rows(event_id, event_data) -> list:
+    """
+    Flattens one event into sheet rows, one per selection. Missing competitors
+    (e.g. projected away or not announced yet) are left blank.
+    """
+    rows = []
+    first, second = (list(event_data.get("competitors") or []) + [{}, {}])[:2]
+    for market in event_data.get("markets", []):
+        if "market_lines" in market.keys():
+            for market_line in market.get("market_lines", []):
+                for selection in market_line.get("selections", []):
+                    rows.append(
+                        # Create row data dictionary
+                        [
+                            event_id,
+                            datetime.strptime(
+                                event_data.get("scheduled", ""),
+                                "%Y-%m-%dT%H:%M:%SZ",
+                            )
+                            .replace(tzinfo=pytz.UTC)
+                            .astimezone(pytz.timezone("America/New_York"))
+                            .__str__(),
+                            event_data.get("display_name", ""),
+                            first.get("display_name", ""),
+                            first.get("abbreviation", ""),
+                            first.get("side", ""),
+                            second.get("display_name", ""),
+                            second.get("abbreviation", ""),
+                            second.get("side", ""),
+                            market.get("id", ""),
+                            market.get("name", ""),
+                            market.get("type", ""),
+                            market.get("status", ""),
+                            market_line.get("id", ""),
+                            market_line.get("name", ""),
+                            market_line.get("line", ""),
+                            market_line.get("favourite", "NA"),
+                            market_line.get("type", ""),
+                            selection[0].get("line_id", ""),
+                            selection[0].get("display_name", ""),
+                            selection[0].get("odds", ""),
+                            event_data.get("status", ""),
+                            selection[0].get("stake", ""),
+                            selection[0].get("value", ""),
+                            datetime.utcfromtimestamp(
+                                market.get("updated_at", "0") / 1e9
+                            )
+                            .replace(tzinfo=timezone.utc)
+                            .astimezone(pytz.timezone("US/Eastern"))
+                            .__str__(),
+                        ]
+                    )
+        else:
+            for selection in market.get("selections", []):
+                for select in selection:
+                    rows.append(
+                        # Create row data dictionary
+                        [
+                            event_id,
+                            event_data.get("scheduled", ""),
+                            event_data.get("display_name", ""),
+                            first.get("display_name", ""),
+                            first.get("abbreviation", ""),
+                            first.get("side", ""),
+                            second.get("display_name", ""),
+                            second.get("abbreviation", ""),
+                            second.get("side", ""),
+                            market.get("id", ""),
+                            market.get("name", ""),
+                            market.get("type", ""),
+                            market.get("status", ""),
+                            "NA",
+                            "NA",
+                            "NA",
+                            "NA",
+                            "NA",
+                            select.get("line_id", ""),
+                            select.get("display_name", ""),
+                            select.get("odds", ""),
+                            event_data.get("status", ""),
+                            select.get("stake", ""),
+                            select.get("value", ""),
+                            datetime.fromtimestamp(
+                                market.get("updated_at", "0") / 1e9
+                            ).__str__(),
+                        ]
+                    )
+    return rows
+
+
+@profiled("extract_event_data_for_sheets")
+def extract_event_data_for_sheets(mm_instance):
+    """
+    Extracts event and market data from mm_instance.sport_events and returns it
+    in a list-of-lists format suitable for Google Sheets.
+
+    Each row could represent:
+    Event Name | Market Type | Selection Name | Line ID
+    """
+    data_to_write = [list(HEADER)]
+    for event_id, event_data in mm_instance.sport_events.items():
+        data_to_write.extend(event_rows(event_id, event_data))
+    return data_to_write
@@ -0,0 +1,283 @@
+import csv
+import gzip
+import os
+import re
+import sqlite3
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import sheets
+from log import logging
+
+# Columns that are written as numbers in typed (Parquet) output
+NUMERIC_COLUMNS = ("Selection Odds", "Selection Stake", "Selection Value")
+SNAPSHOT_COLUMN = "Snapshot At"
+
+
+def event_tournament(mm_instance, event: dict) -> str:
+    """
+    The tournament name of an event, as stamped during seeding.
+    """
+    if event.get("tournament_name"):
+        return event["tournament_name"]
+    tournament = mm_instance.my_tournaments.get(event.get("tournament_id"), {})
+    return tournament.get("name", "unknown")
+
+
+class FileSink:
+    """
+    Base class for file exports of the flattened book.
+
+    Files are partitioned Hive-style by snapshot date and tournament:
+        <root>/date=YYYY-MM-DD/tournament=<name>/snapshot-<run_id>.<extension>
+    Every run writes new files and never rewrites old ones, so each directory
+    accumulates append-only snapshots. Each row also carries the snapshot time.
+    """
+    extension: str = None
+
+    def __init__(self, root: str = "exports", run_id: str = None, snapshot_at: datetime = None):
+        self.root = root
+        self.snapshot_at = snapshot_at or datetime.now(timezone.utc)
+        self.run_id = run_id or f"{self.snapshot_at:%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:8]}"
+        self.header = None
+        self.paths = []
+
+    def partition_path(self, tournament: str) -> str:
+        safe_tournament = re.sub(r"[^\w.-]+", "_", tournament).strip("_") or "unknown"
+        directory = os.path.join(self.root, f"date={self.snapshot_at:%Y-%m-%d}", f"tournament={safe_tournament}")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"snapshot-{self.run_id}.{self.extension}")
+
+    def open(self, header: list = None):
+        self.header = list(header or sheets.HEADER) + [SNAPSHOT_COLUMN]
+
+    def write_rows(self, rows: list, tournament: str):
+        raise NotImplementedError
+
+    def close(self):
+        logging.info(f"wrote {len(self.paths)} {self.extension} files under {self.root}")
+
+    def abort(self):
+        """
+        Removes the files of a failed export, so no partial snapshot is left behind.
+        """
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        logging.info(f"removed {len(self.paths)} partial {self.extension} files under {self.root}")
+        self.paths = []
+
+
+class CsvSink(FileSink):
+    """
+    Writes one gzip-compressed CSV per partition.
+    """
+    extension = "csv.gz"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._files = dict()  # tournament -> (file object, csv writer)
+
+    def write_rows(self, rows: list, tournament: str):
+        if tournament not in self._files:
+            path = self.partition_path(tournament)
+            fp = gzip.open(path, "wt", newline="")
+            writer = csv.writer(fp)
+            writer.writerow(self.header)
+            self._files[tournament] = (fp, writer)
+            self.paths.append(path)
+        snapshot_at = self.snapshot_at.isoformat()
+        self._files[tournament][1].writerows(row + [snapshot_at] for row in rows)
+
+    def close(self):
+        for fp, _ in self._files.values():
+            fp.close()
+        self._files = dict()
+        super().close()
+
+    def abort(self):
+        for fp, _ in self._files.values():
+            try:
+                fp.close()
+            except Exception:
+                pass
+        self._files = dict()
+        super().abort()
+
+
+class ParquetSink(FileSink):
+    """
+    Writes one Parquet file per partition, streaming a row group every
+    row_group_size rows so memory stays bounded however large the book is.
+    """
+    extension = "parquet"
+
+    def __init__(self, *args, row_group_size: int = 50000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.row_group_size = row_group_size
+        self._writers = dict()  # tournament -> pyarrow.parquet.ParquetWriter
+        self._buffers = dict()  # tournament -> rows not yet written
+        self._schema = None
+
+    def open(self, header: list = None):
+        import pyarrow as pa
+
+        super().open(header)
+        self._schema = pa.schema([
+            (column, pa.float64() if column in NUMERIC_COLUMNS else
+             pa.timestamp("us", tz="UTC") if column == SNAPSHOT_COLUMN else pa.string())
+            for column in self.header
+        ])
+
+    def write_rows(self, rows: list, tournament: str):
+        buffer = self._buffers.setdefault(tournament, [])
+        buffer.extend(rows)
+        while len(buffer) >= self.row_group_size:
+            self._write_row_group(tournament, buffer[:self.row_group_size])
+            del buffer[:self.row_group_size]
+
+    def _write_row_group(self, tournament: str, rows: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not rows:
+            return
+        columns = []
+        for index, field in enumerate(self._schema):
+            if field.name == SNAPSHOT_COLUMN:
+                columns.append([self.snapshot_at] * len(rows))
+            elif field.name in NUMERIC_COLUMNS:
+                columns.append([_to_float(row[index]) for row in rows])
+            else:
+                columns.append([None if row[index] is None else str(row[index]) for row in rows])
+        table = pa.Table.from_arrays([pa.array(column, type=field.type)
+                                      for column, field in zip(columns, self._schema)], schema=self._schema)
+
+        if tournament not in self._writers:
+            path = self.partition_path(tournament)
+            self._writers[tournament] = pq.ParquetWriter(path, self._schema, compression="snappy")
+            self.paths.append(path)
+        self._writers[tournament].write_table(table)
+
+    def close(self):
+        for tournament, rows in self._buffers.items():
+            self._write_row_group(tournament, rows)
+        self._buffers = dict()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = dict()
+        super().close()
+
+    def abort(self):
+        self._buffers = dict()
+        for writer in self._writers.values():
+            try:
+                writer.close()
+            except Exception:
+                pass
+        self._writers = dict()
+        super().abort()
+
+
+class SheetsSink:
+    """
+    Appends the rows to a Google Sheet in chunks of chunk_rows, one API call each.
+    Rows are buffered in memory, so its fan-out buffer rarely fills up.
+    """
+    buffer_size = 1024
+
+    def __init__(self, sheet_name: str, chunk_rows: int = 20000):
+        self.sheet_name = sheet_name
+        self.chunk_rows = chunk_rows
+        self._pending = []
+
+    def open(self, header: list = None):
+        self._pending = [list(header or sheets.HEADER)]
+
+    def write_rows(self, rows: list, tournament: str):
+        self._pending.extend(rows)
+        if len(self._pending) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            # Errors propagate, so the fan-out records and aborts a failed Sheets export
+            sheets.append_rows(self.sheet_name, self._pending)
+            logging.info(f"wrote {len(self._pending)} rows to {self.sheet_name}")
+            self._pending = []
+
+    def close(self):
+        self._flush()
+
+    def abort(self):
+        # Rows already appended cannot be taken back, but nothing more is sent
+        self._pending = []
+
+
+class SqliteSink:
+    """
+    Inserts the rows into an odds_snapshots table of a SQLite database, tagged
+    with the tournament and snapshot time.
+    """
+
+    def __init__(self, path: str = os.path.join("exports", "odds.sqlite"), snapshot_at: datetime = None):
+        self.path = path
+        self.snapshot_at = snapshot_at or datetime.now(timezone.utc)
+        self._connection = None
+        self._insert = None
+
+    def open(self, header: list = None):
+        columns = list(header or sheets.HEADER) + ["Tournament", SNAPSHOT_COLUMN]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Opened here, so the connection belongs to the thread that writes to it
+        self._connection = sqlite3.connect(self.path)
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        self._connection.execute(f"CREATE TABLE IF NOT EXISTS odds_snapshots ({quoted})")
+        self._insert = f"INSERT INTO odds_snapshots ({quoted}) VALUES ({', '.join('?' * len(columns))})"
+
+    def write_rows(self, rows: list, tournament: str):
+        snapshot_at = self.snapshot_at.isoformat()
+        self._connection.executemany(self._insert, (
+            [value if value is None or isinstance(value, (int, float, str)) else str(value) for value in row]
+            + [tournament, snapshot_at]
+            for row in rows
+        ))
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+        self._connection = None
+        logging.info(f"wrote snapshot to {self.path}")
+
+    def abort(self):
+        # Nothing is committed until close(), so the snapshot is dropped entirely
+        if self._connection is not None:
+            self._connection.rollback()
+            self._connection.close()
+            self._connection = None
+
+
+class StdoutSink:
+    """
+    Prints the rows as CSV to stdout.
+    """
+
+    def open(self, header: list = None):
+        self._writer = csv.writer(sys.stdout)
+        self._writer.writerow(list(header or sheets.HEADER) + ["Tournament"])
+
+    def write_rows(self, rows: list, tournament: str):
+        self._writer.writerows(row + [tournament] for row in rows)
+
+    def close(self):
+        sys.stdout.flush()
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
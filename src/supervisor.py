@@ -0,0 +1,200 @@
+import multiprocessing
+import queue
+import time
+from collections import Counter
+
+import config
+from log import logging
+
+
+def shard_tournaments(tournaments: list, n_shards: int) -> list:
+    """
+    Splits the tournament names round-robin into at most n_shards non-empty lists.
+    """
+    n_shards = max(1, min(n_shards, len(tournaments)))
+    return [tournaments[i::n_shards] for i in range(n_shards)]
+
+
+def _run_shard(shard_index: int, mm_keys: dict, tournaments: list, results, stop_event,
+               live: bool, trade: bool, publish_interval: float, budget_shares: int = 1):
+    """
+    Worker process entry point. Seeds one shard with its own session and publishes
+    the book to the supervisor. When live, it keeps the websocket open, refreshes the
+    session on schedule and every publish_interval seconds publishes only the events
+    that changed or left the book since the last publish. The shard gets
+    1/budget_shares of the request rate, budget_shares being the number of shards
+    on the same account.
+
+    Messages are (shard_index, my_tournaments, changed events, removed event ids),
+    or (shard_index, None, exception, None) when the shard failed.
+    """
+    try:
+        # Imported in the try, so an import error is reported like any other failure
+        import mm_calls
+        import ratelimit
+
+        mm_instance = mm_calls.MMInteractions(mm_keys=mm_keys, tournaments=tournaments,
+                                              budget=ratelimit.budget_share(budget_shares))
+        mm_instance.mm_login()
+        mm_instance.seeding()
+        published = mm_instance.sport_events
+        results.put((shard_index, dict(mm_instance.my_tournaments), dict(published), []))
+        if not live:
+            return
+
+        mm_instance.subscribe()
+        if trade:
+            mm_instance.auto_playing()  # Also schedules the session refresh and runs the scheduler
+        else:
+            mm_instance.schedule_session_refresh()
+            mm_instance.keep_alive()
+        while not stop_event.wait(publish_interval):
+            snapshot = mm_instance.sport_events
+            if snapshot.version == published.version:
+                continue
+            # Updates replace the events they touch (copy-on-write), so identity tells what changed
+            changed = {event_id: event for event_id, event in snapshot.items() if published.get(event_id) is not event}
+            removed = [event_id for event_id in published if event_id not in snapshot]
+            published = snapshot
+            if changed or removed:
+                results.put((shard_index, dict(mm_instance.my_tournaments), changed, removed))
+    except Exception as e:
+        logging.error(f"shard {shard_index} failed: {e}")
+        results.put((shard_index, None, e, None))
+
+
+class Supervisor:
+    """
+    Splits TOURNAMENTS_INTERESTED across worker processes, each running its own
+    MMInteractions (session, websocket, scheduler), and merges their books. Live
+    workers publish the events that changed every publish_interval seconds.
+
+    Exposes sport_events and my_tournaments like MMInteractions, so the merged book
+    can be handed straight to the flattener.
+    """
+
+    def __init__(self, n_workers: int, accounts: list = None, tournaments: list = None,
+                 live: bool = False, trade: bool = False, publish_interval: float = 30,
+                 change_feed=None):
+        self.accounts = accounts if accounts is not None else config.MM_ACCOUNTS
+        self.shards = shard_tournaments(
+            tournaments if tournaments is not None else config.TOURNAMENTS_INTERESTED, n_workers
+        )
+        self.live = live
+        self.trade = trade
+        self.publish_interval = publish_interval
+        self.change_feed = change_feed  # Fed with each shard book as it is merged
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._stop_event = self._ctx.Event()
+        self._processes = []
+        self._shard_tournaments = dict()  # shard index -> my_tournaments of that shard
+        self._shard_events = dict()       # shard index -> sport_events of that shard
+        self._failed = set()
+
+    def start(self):
+        """
+        Starts one worker process per shard. Accounts are assigned round-robin, and
+        shards on the same account split its request rate between them.
+        """
+        shard_keys = [self.accounts[shard_index % len(self.accounts)] for shard_index in range(len(self.shards))]
+        shards_per_account = Counter(mm_keys["access_key"] for mm_keys in shard_keys)
+        for shard_index, tournaments in enumerate(self.shards):
+            mm_keys = shard_keys[shard_index]
+            process = self._ctx.Process(
+                target=_run_shard,
+                args=(shard_index, mm_keys, tournaments, self._results, self._stop_event,
+                      self.live, self.trade, self.publish_interval, shards_per_account[mm_keys["access_key"]]),
+                name=f"mm-shard-{shard_index}",
+                daemon=False,
+            )
+            process.start()
+            self._processes.append(process)
+            logging.info(f"started shard {shard_index} with {len(tournaments)} tournaments")
+
+    def poll(self, timeout: float = None) -> int:
+        """
+        Merges every book (or book change) published by the workers since the last
+        call. Blocks up to timeout seconds for the first one and returns how many were
+        merged.
+        """
+        merged = 0
+        block = True
+        while True:
+            try:
+                shard_index, my_tournaments, changed, removed = self._results.get(block=block, timeout=timeout)
+            except queue.Empty:
+                return merged
+            block = False
+            if my_tournaments is None:
+                self._failed.add(shard_index)
+            else:
+                self._shard_tournaments[shard_index] = my_tournaments
+                shard_events = self._shard_events.setdefault(shard_index, dict())
+                shard_events.update(changed)
+                for event_id in removed:
+                    shard_events.pop(event_id, None)
+                if self.change_feed is not None:
+                    self.change_feed.observe_book(changed)
+                    for event_id in removed:
+                        self.change_feed.observe_event(event_id, None)
+            merged += 1
+
+    def _mark_dead_shards(self):
+        """
+        Marks as failed the shards whose process exited (e.g. killed by the OS)
+        without publishing a book or a failure.
+        """
+        exited = [shard_index for shard_index, process in enumerate(self._processes)
+                  if process.exitcode is not None
+                  and shard_index not in self._shard_events and shard_index not in self._failed]
+        if not exited:
+            return
+        self.poll(timeout=0)  # Anything a worker sent before exiting is merged first
+        for shard_index in exited:
+            if shard_index not in self._shard_events and shard_index not in self._failed:
+                logging.error(f"shard {shard_index} exited with code {self._processes[shard_index].exitcode} "
+                              f"before publishing its book")
+                self._failed.add(shard_index)
+
+    def wait_seeded(self, timeout: float = None, check_interval: float = 1.0):
+        """
+        Blocks until every shard has published its first book or failed. Every
+        check_interval seconds, shards whose process died are marked as failed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self._shard_events) + len(self._failed) < len(self.shards):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            self.poll(timeout=check_interval if remaining is None else min(remaining, check_interval))
+            self._mark_dead_shards()
+        logging.info(f"{len(self._shard_events)}/{len(self.shards)} shards seeded, "
+                     f"{len(self.sport_events)} sport events merged")
+
+    def stop(self):
+        """
+        Signals live workers to stop and waits for the processes to exit.
+        """
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout=self.publish_interval)
+            if process.is_alive():
+                # Live workers keep a non-daemon scheduler thread, so terminate them
+                process.terminate()
+                process.join()
+        self._processes = []
+
+    @property
+    def my_tournaments(self) -> dict:
+        merged = dict()
+        for shard_tournaments in self._shard_tournaments.values():
+            merged.update(shard_tournaments)
+        return merged
+
+    @property
+    def sport_events(self) -> dict:
+        merged = dict()
+        for shard_events in self._shard_events.values():
+            merged.update(shard_events)
+        return merged
@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import deque
+
+import sheets
+from config import SPREADSHEET_ID
+from log import logging
+
+
+class SheetWatcher:
+    """
+    Keeps a Google Sheet in step with a live book at bounded API cost.
+
+    The sheet is written in full once; afterwards only rows whose selection changed
+    (as reported by the book's change feed) are rewritten, every flush_interval
+    seconds, in a single batchUpdate call. New selections are written below the last
+    row, and rows of selections that left the book are blanked. No more than
+    max_calls_per_minute Sheets calls are made; when the budget is spent the dirty
+    rows simply wait for the next flush.
+    """
+
+    def __init__(self, mm_instance, sheet_name: str, flush_interval: float = 10,
+                 max_calls_per_minute: int = 30):
+        if mm_instance.change_feed is None:
+            raise Exception("watch mode needs an MMInteractions with a change feed")
+        self.mm_instance = mm_instance
+        self.sheet_name = sheet_name
+        self.flush_interval = flush_interval
+        self.max_calls_per_minute = max_calls_per_minute
+        self._row_by_line_id = dict()  # line_id -> 1-based sheet row
+        self._next_row = 1
+        self._dirty = dict()           # line_id -> event_id, rows waiting to be written
+        self._calls = deque()          # Timestamps of recent Sheets calls
+        self._dirty_lock = threading.Lock()  # Change callbacks arrive on the websocket thread
+        mm_instance.change_feed.subscribe(self._on_changes)
+
+    def _on_changes(self, records: list):
+        with self._dirty_lock:
+            for record in records:
+                self._dirty[record["line_id"]] = record["event_id"]
+
+    def _mark_dirty(self, dirty: dict):
+        with self._dirty_lock:
+            for line_id, event_id in dirty.items():
+                self._dirty.setdefault(line_id, event_id)
+
+    def _spend(self, calls: int) -> bool:
+        """
+        Records calls against the per-minute budget, or returns False if they do not fit.
+        """
+        now = time.monotonic()
+        while self._calls and now - self._calls[0] >= 60:
+            self._calls.popleft()
+        if len(self._calls) + calls > self.max_calls_per_minute:
+            return False
+        self._calls.extend([now] * calls)
+        return True
+
+    def write_full(self) -> bool:
+        """
+        Clears the sheet and writes the whole book, remembering the row of every line.
+        Returns False if the write did not happen (over budget or an API error).
+        """
+        from googleapiclient.errors import HttpError
+
+        # Changes reported from here on are rewritten by the next flush, so none are lost
+        # while the snapshot is being written
+        with self._dirty_lock:
+            self._dirty = dict()
+        data_to_write = sheets.extract_event_data_for_sheets(self.mm_instance)
+        if not self._spend(2):
+            logging.info("sheets call budget spent, postponing full write", extra={'rate_key': 'watch_budget'})
+            return False
+        values = sheets.get_service().spreadsheets().values()
+        try:
+            values.clear(spreadsheetId=SPREADSHEET_ID, range=self.sheet_name).execute()
+            values.update(
+                spreadsheetId=SPREADSHEET_ID,
+                range=self.sheet_name + "!A1",
+                body={"values": data_to_write},
+                valueInputOption="RAW",
+            ).execute()
+        except HttpError as err:
+            logging.error(f"Error occurred while writing to Google Sheets: {err}")
+            return False
+
+        self._row_by_line_id = {row[sheets.LINE_ID_COLUMN]: index + 1
+                                for index, row in enumerate(data_to_write) if index > 0}
+        self._next_row = len(data_to_write) + 1
+        logging.info(f"wrote {len(data_to_write) - 1} rows to {self.sheet_name}")
+        return True
+
+    def flush(self):
+        """
+        Rewrites the dirty rows and appends new ones, within the call budget.
+        """
+        from googleapiclient.errors import HttpError
+
+        self.mm_instance.change_feed.flush()
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, dict()
+        if not dirty:
+            return
+
+        sport_events = self.mm_instance.sport_events
+        updates, appends = [], []
+        written = set()
+        for event_id in set(dirty.values()):
+            if event_id not in sport_events:
+                continue
+            for row in sheets.event_rows(event_id, sport_events[event_id]):
+                line_id = row[sheets.LINE_ID_COLUMN]
+                if line_id not in dirty:
+                    continue
+                written.add(line_id)
+                if line_id in self._row_by_line_id:
+                    updates.append({"range": f"{self.sheet_name}!A{self._row_by_line_id[line_id]}",
+                                    "values": [row]})
+                else:
+                    appends.append(row)
+        for line_id in dirty.keys() - written:
+            # The selection left the book, blank its row
+            if line_id in self._row_by_line_id:
+                updates.append({"range": f"{self.sheet_name}!A{self._row_by_line_id[line_id]}",
+                                "values": [[""] * len(sheets.HEADER)]})
+
+        if not updates and not appends:
+            return
+        if appends:
+            # New rows go at explicit rows after the last one written. values.append would
+            # write after the first gap (e.g. a blanked row) and overwrite live rows.
+            updates.append({"range": f"{self.sheet_name}!A{self._next_row}", "values": appends})
+
+        if not self._spend(1):
+            # Over budget, keep the rows dirty for the next flush
+            self._mark_dirty(dirty)
+            logging.info("sheets call budget spent, postponing flush", extra={'rate_key': 'watch_budget'})
+            return
+
+        values = sheets.get_service().spreadsheets().values()
+        try:
+            values.batchUpdate(spreadsheetId=SPREADSHEET_ID,
+                               body={"valueInputOption": "RAW", "data": updates}).execute()
+        except HttpError as err:
+            self._mark_dirty(dirty)
+            logging.error(f"Error occurred while writing to Google Sheets: {err}")
+            return
+        for row in appends:
+            self._row_by_line_id[row[sheets.LINE_ID_COLUMN]] = self._next_row
+            self._next_row += 1
+        logging.info(f"flushed {len(updates) - bool(appends)} updated and {len(appends)} new rows to {self.sheet_name}")
+
+    def run_forever(self, wait=None):
+        """
+        Writes the sheet once, then flushes dirty rows every flush_interval seconds.
+        A failed full write is retried every flush_interval seconds instead.
+        wait, if given, is called instead of sleeping between flushes (the supervisor
+        uses it to merge worker books).
+        """
+        written = self.write_full()
+        while True:
+            if wait is None:
+                time.sleep(self.flush_interval)
+            else:
+                wait()
+            if written:
+                self.flush()
+            else:
+                written = self.write_full()
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+
+# The modules live flat in src/ and are imported by name, as when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+# Keep log files of the test run out of the working tree
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="mm-test-logs-"))
+
+import pytest  # noqa: E402
+
+
+def make_selection(line_id, odds=100, stake=10, value=5, **fields) -> dict:
+    return {"line_id": line_id, "display_name": f"selection {line_id}", "odds": odds,
+            "stake": stake, "value": value, **fields}
+
+
+def make_event(event_id, markets: list = None, **fields) -> dict:
+    """
+    An event shaped like the seeded book: a moneyline market (selections as a list
+    of lists) and a spread market with market_lines.
+    """
+    if markets is None:
+        markets = [
+            {"id": event_id * 10 + 1, "name": "Moneyline", "type": "moneyline", "status": "active",
+             "updated_at": 1700000000000000000,
+             "selections": [[make_selection(f"{event_id}-ml-home")], [make_selection(f"{event_id}-ml-away")]]},
+            {"id": event_id * 10 + 2, "name": "Spread", "type": "spread", "status": "active",
+             "updated_at": 1700000000000000000,
+             "market_lines": [{"id": f"{event_id}-line", "name": "-1.5", "line": -1.5, "type": "spread",
+                               "selections": [[make_selection(f"{event_id}-sp-home")],
+                                              [make_selection(f"{event_id}-sp-away")]]}]},
+        ]
+    return {
+        "event_id": event_id,
+        "name": f"Home {event_id} vs Away {event_id}",
+        "display_name": f"Home {event_id} vs Away {event_id}",
+        "scheduled": "2030-01-01T18:00:00Z",
+        "status": "not_started",
+        "tournament_id": 1,
+        "tournament_name": "Premier League",
+        "competitors": [{"display_name": f"Home {event_id}", "abbreviation": "HOM", "side": "home"},
+                        {"display_name": f"Away {event_id}", "abbreviation": "AWY", "side": "away"}],
+        "markets": markets,
+        **fields,
+    }
+
+
+class FakeInstance:
+    """
+    Stands in for MMInteractions where only the book is read.
+    """
+
+    def __init__(self, sport_events: dict, my_tournaments: dict = None):
+        self.sport_events = sport_events
+        self.my_tournaments = my_tournaments or {1: {"name": "Premier League"}}
+
+
+@pytest.fixture
+def book():
+    return {event_id: make_event(event_id) for event_id in (1, 2, 3)}
@@ -0,0 +1,112 @@
+import threading
+
+import book
+from book import VersionedBook
+from conftest import make_event, make_selection
+
+
+def _seeded(n_events=3) -> VersionedBook:
+    versioned = VersionedBook()
+    versioned.put_many({event_id: make_event(event_id) for event_id in range(1, n_events + 1)})
+    return versioned
+
+
+def _odds(snapshot, line_id):
+    for event in snapshot.values():
+        for _, _, selection in book.iter_selections(event):
+            if selection["line_id"] == line_id:
+                return selection["odds"]
+
+
+def test_snapshot_is_isolated_from_later_updates():
+    versioned = _seeded()
+    before = versioned.snapshot()
+    event_id = versioned.apply_update({"change_type": "selections", "op": "u",
+                                       "info": [{"line_id": "2-sp-home", "odds": 250}]})
+    after = versioned.snapshot()
+
+    assert event_id == 2
+    assert (before.version, after.version) == (1, 2)
+    assert _odds(before, "2-sp-home") == 100
+    assert _odds(after, "2-sp-home") == 250
+
+
+def test_update_copies_only_the_changed_path():
+    versioned = _seeded()
+    before = versioned.snapshot()
+    versioned.apply_update({"change_type": "selection", "op": "u", "info": {"line_id": "2-ml-away", "odds": -120}})
+    after = versioned.snapshot()
+
+    assert after[1] is before[1] and after[3] is before[3]  # Untouched events are shared
+    moneyline_before, spread_before = before[2]["markets"]
+    moneyline_after, spread_after = after[2]["markets"]
+    assert spread_after is spread_before  # Untouched market is shared
+    assert moneyline_after is not moneyline_before
+    assert moneyline_after["selections"][0] is moneyline_before["selections"][0]
+    assert moneyline_after["selections"][1][0] == {**moneyline_before["selections"][1][0], "odds": -120}
+
+
+def test_selection_payloads_without_event_id_use_the_line_index():
+    versioned = _seeded(n_events=50)
+    assert versioned._line_events["37-sp-away"] == 37
+    assert versioned.apply_update({"change_type": "selection", "info": {"line_id": "37-sp-away", "odds": 300}}) == 37
+    assert versioned.apply_update({"change_type": "selection", "info": {"line_id": "unknown", "odds": 300}}) is None
+
+
+def test_market_and_event_changes_keep_the_line_index():
+    versioned = _seeded()
+    new_market = {"id": 99, "type": "moneyline", "status": "active", "updated_at": 0, "event_id": 1,
+                  "selections": [[make_selection("1-new")]]}
+    assert versioned.apply_update({"change_type": "market", "op": "c", "info": new_market}) == 1
+    assert versioned._line_events["1-new"] == 1
+    assert versioned.apply_update({"change_type": "market", "op": "d", "info": new_market}) == 1
+    assert "1-new" not in versioned._line_events
+
+    before = versioned.snapshot()
+    assert versioned.apply_update({"change_type": "sport_event", "op": "d", "info": {"event_id": 3}}) == 3
+    after = versioned.snapshot()
+    assert 3 in before and 3 not in after
+    assert (len(before), len(after)) == (3, 2)
+    assert "3-ml-home" not in versioned._line_events
+    assert sorted(after) == [1, 2]
+
+
+def test_sport_event_update_keeps_markets():
+    versioned = _seeded()
+    versioned.apply_update({"change_type": "sport_event", "op": "u",
+                            "info": {"event_id": 1, "status": "live", "markets": []}})
+    event = versioned.snapshot()[1]
+    assert event["status"] == "live"
+    assert len(event["markets"]) == 2
+
+
+def test_readers_see_consistent_versions_while_writing():
+    versioned = _seeded(n_events=20)
+    stop = threading.Event()
+
+    def write():
+        odds = 0
+        while not stop.is_set():
+            odds += 1
+            # Both sides of one market always move together
+            versioned.apply_update({"change_type": "selections", "event_id": 5,
+                                    "info": [{"line_id": "5-ml-home", "odds": odds},
+                                             {"line_id": "5-ml-away", "odds": odds}]})
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(2000):
+            snapshot = versioned.snapshot()
+            assert _odds(snapshot, "5-ml-home") == _odds(snapshot, "5-ml-away")
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_plain_apply_update_replaces_instead_of_mutating():
+    sport_events = {1: make_event(1)}
+    original = sport_events[1]
+    book.apply_update(sport_events, {"change_type": "selection", "info": {"line_id": "1-ml-home", "odds": 5}})
+    assert original["markets"][0]["selections"][0][0]["odds"] == 100
+    assert sport_events[1]["markets"][0]["selections"][0][0]["odds"] == 5
@@ -0,0 +1,98 @@
+import threading
+
+from changefeed import OddsChangeFeed
+from conftest import make_event
+
+
+def _set_odds(event, line_id, odds):
+    for market in event["markets"]:
+        groups = [group for line in market.get("market_lines", []) for group in line["selections"]]
+        for group in groups or market.get("selections", []):
+            for selection in group:
+                if selection["line_id"] == line_id:
+                    selection["odds"] = odds
+
+
+def test_new_lines_and_unchanged_observations():
+    feed = OddsChangeFeed(coalesce_window=1, auto_flush=False)
+    assert feed.observe_event(1, make_event(1), now=0) == 4
+    assert feed.observe_event(1, make_event(1), now=0.5) == 0
+    records = feed.flush(now=1)
+    assert sorted(record["line_id"] for record in records) == ["1-ml-away", "1-ml-home", "1-sp-away", "1-sp-home"]
+    assert all(record["previous"] is None for record in records)
+    assert feed.last_value("1-ml-home")["odds"] == 100
+
+
+def test_changes_within_the_window_are_coalesced():
+    feed = OddsChangeFeed(coalesce_window=1, auto_flush=False)
+    event = make_event(1)
+    feed.observe_event(1, event, now=0)
+    feed.flush(now=0, force=True)
+
+    for now, odds in ((10, 110), (10.2, 120), (10.4, 130)):
+        _set_odds(event, "1-ml-home", odds)
+        assert feed.observe_event(1, event, now=now) == 1
+    assert feed.flush(now=10.5) == []  # Window still open
+
+    [record] = feed.flush(now=11)
+    assert (record["previous"]["odds"], record["current"]["odds"]) == (100, 130)
+    assert record["market_id"] == 11
+    assert feed.changes_after(record["seq"] - 1) == [record]
+    assert feed.changes_since(10.9) == [record]
+
+
+def test_burst_ending_where_it_started_publishes_nothing():
+    feed = OddsChangeFeed(coalesce_window=1, auto_flush=False)
+    event = make_event(1)
+    feed.observe_event(1, event, now=0)
+    feed.flush(now=0, force=True)
+    _set_odds(event, "1-ml-home", 150)
+    feed.observe_event(1, event, now=5)
+    _set_odds(event, "1-ml-home", 100)
+    feed.observe_event(1, event, now=5.5)
+    assert feed.flush(now=7) == []
+
+
+def test_removed_selections_and_events_are_reported_and_forgotten():
+    feed = OddsChangeFeed(coalesce_window=1, auto_flush=False)
+    event = make_event(1)
+    feed.observe_event(1, event, now=0)
+    feed.flush(now=0, force=True)
+
+    event["markets"] = event["markets"][1:]  # Moneyline market removed
+    assert feed.observe_event(1, event, now=5) == 2
+    records = feed.flush(now=5, force=True)
+    assert sorted(record["line_id"] for record in records) == ["1-ml-away", "1-ml-home"]
+    assert all(record["current"] is None and record["previous"]["odds"] == 100 for record in records)
+    assert feed.last_value("1-ml-home") is None
+
+    assert feed.observe_event(1, None, now=6) == 2
+    assert sorted(record["line_id"] for record in feed.flush(now=6, force=True)) == ["1-sp-away", "1-sp-home"]
+    assert feed._last == {} and feed._event_lines == {}
+
+
+def test_timer_publishes_the_last_change_of_a_burst():
+    feed = OddsChangeFeed(coalesce_window=0.05)
+    published = threading.Event()
+    received = []
+    feed.subscribe(lambda records: (received.extend(records), published.set()))
+
+    feed.observe_event(1, make_event(1))
+    # No further observe or flush call: the timer has to publish the window
+    assert published.wait(2)
+    assert len(received) == 4
+    assert feed._timer is None
+
+
+def test_stale_timer_does_not_publish_a_newer_window():
+    feed = OddsChangeFeed(coalesce_window=10, auto_flush=False)
+    event = make_event(1)
+    feed.observe_event(1, event, now=0)
+    feed.flush(now=10)  # First window published, e.g. by an observe racing its timer
+    _set_odds(event, "1-ml-home", 150)
+    feed.observe_event(1, event, now=11)
+
+    feed._flush_window(0)  # The first window's timer fires late
+    assert feed._pending and feed._window_started == 11
+    feed._flush_window(11)
+    assert feed._pending == {} and feed.changes_after(4)[0]["current"]["odds"] == 150
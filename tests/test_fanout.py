@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from conftest import FakeInstance
+from fanout import FanOut
+import main
+import sinks
+
+
+class ListSink:
+    def __init__(self, fail_on=None, buffer_size=None):
+        self.fail_on = fail_on
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
+        self.rows = []
+        self.calls = []
+
+    def open(self, header=None):
+        self.calls.append("open")
+        if self.fail_on == "open":
+            raise RuntimeError("open failed")
+
+    def write_rows(self, rows, tournament):
+        if self.fail_on == "write":
+            raise RuntimeError("write failed")
+        self.rows.extend(rows)
+
+    def close(self):
+        self.calls.append("close")
+        if self.fail_on == "close":
+            raise RuntimeError("close failed")
+
+    def abort(self):
+        self.calls.append("abort")
+
+
+def test_every_sink_gets_every_row(book):
+    first, second = ListSink(), ListSink()
+    errors = FanOut([first, second], batch_rows=3).run(FakeInstance(book))
+    assert errors == {}
+    assert len(first.rows) == len(second.rows) == 12
+    assert first.calls == second.calls == ["open", "close"]
+
+
+@pytest.mark.parametrize("fail_on", ["open", "write"])
+def test_failing_sink_is_aborted_and_others_finish(book, fail_on):
+    failing, healthy = ListSink(fail_on=fail_on, buffer_size=1), ListSink()
+    errors = FanOut([failing, healthy], batch_rows=1).run(FakeInstance(book))
+    assert list(errors) == [failing]
+    assert failing.calls == ["open", "abort"]
+    assert len(healthy.rows) == 12
+
+
+def test_failing_close_does_not_hang(book):
+    failing, healthy = ListSink(fail_on="close"), ListSink()
+    errors = FanOut([failing, healthy]).run(FakeInstance(book))
+    assert list(errors) == [failing]
+    assert failing.calls == ["open", "close"]  # Not aborted after close was attempted
+    assert len(healthy.rows) == 12
+
+
+def test_failed_csv_export_leaves_no_partial_files(book, tmp_path, monkeypatch):
+    csv_sink = sinks.CsvSink(root=str(tmp_path))
+    write_rows = csv_sink.write_rows
+    written = []
+
+    def write_then_fail(rows, tournament):
+        write_rows(rows, tournament)
+        written.append(rows)
+        if len(written) == 2:
+            raise OSError("disk full")
+
+    monkeypatch.setattr(csv_sink, "write_rows", write_then_fail)
+    errors = FanOut([csv_sink], batch_rows=1).run(FakeInstance(book))
+    assert list(errors) == [csv_sink]
+    assert [files for _, _, files in os.walk(tmp_path) if files] == []
+
+
+def test_export_exits_non_zero_when_a_sink_fails(book, monkeypatch):
+    monkeypatch.setattr(main, "_seeded_instance", lambda: FakeInstance(book))
+    monkeypatch.setattr(main, "_build_sinks", lambda args: [ListSink(fail_on="write"), ListSink()])
+    assert main.main(["export", "--sink", "stdout"]) == 1
+
+    monkeypatch.setattr(main, "_build_sinks", lambda args: [ListSink()])
+    assert main.main(["export", "--sink", "stdout"]) is None
+
+
+class _FailingSheetsService:
+    def __init__(self):
+        self.appends = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def append(self, **kwargs):
+        from googleapiclient.errors import HttpError
+
+        self.appends += 1
+        raise HttpError(type("Response", (), {"status": 403, "reason": "forbidden"})(), b"")
+
+
+def test_failed_sheets_write_fails_the_export(book, monkeypatch):
+    import sheets
+
+    service = _FailingSheetsService()
+    monkeypatch.setattr(sheets, "get_service", lambda: service)
+    sheets_sink, healthy = sinks.SheetsSink("Odds", chunk_rows=5), ListSink()
+
+    errors = FanOut([sheets_sink, healthy], batch_rows=1).run(FakeInstance(book))
+    assert list(errors) == [sheets_sink]
+    assert service.appends == 1  # Aborted after the first failed call, nothing more is sent
+    assert sheets_sink._pending == []
+    assert len(healthy.rows) == 12
+
+    monkeypatch.setattr(main, "_seeded_instance", lambda: FakeInstance(book))
+    monkeypatch.setattr(main, "_build_sinks", lambda args: [sinks.SheetsSink("Odds")])
+    assert main.main(["export"]) == 1
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+from conftest import make_event
+from filters import IngestFilter
+import sheets
+
+
+def test_projected_event_still_flattens():
+    ingest_filter = IngestFilter(event_fields=["display_name"], market_fields=["name"])
+    event = ingest_filter.apply(make_event(1, extra="dropped"))
+    assert "extra" not in event
+    rows = sheets.event_rows(1, event)
+    assert len(rows) == 4
+    assert rows[0][3] == "Home 1" and rows[0][6] == "Away 1"
+
+
+def test_flattener_tolerates_missing_competitors():
+    event = make_event(1)
+    event["competitors"] = [{"display_name": "Solo"}]
+    rows = sheets.event_rows(1, event)
+    assert rows[0][3] == "Solo" and rows[0][6] == ""
+    del event["competitors"]
+    assert len(sheets.event_rows(1, event)) == 4
+
+
+def test_market_type_filter_drops_markets_and_empty_events():
+    ingest_filter = IngestFilter(market_types=["spread"])
+    event = ingest_filter.apply(make_event(1))
+    assert [market["type"] for market in event["markets"]] == ["spread"]
+
+    only_moneyline = make_event(2)
+    only_moneyline["markets"] = only_moneyline["markets"][:1]
+    assert ingest_filter.apply(only_moneyline) is None
+
+
+def test_scheduled_window():
+    ingest_filter = IngestFilter(scheduled_from_hours=-6, scheduled_to_hours=48)
+    now = datetime(2030, 1, 1, 12, tzinfo=timezone.utc)
+    assert ingest_filter.accept_event(make_event(1, scheduled="2030-01-01T18:00:00Z"), now=now)
+    assert not ingest_filter.accept_event(make_event(1, scheduled="2030-01-05T18:00:00Z"), now=now)
+    assert not ingest_filter.accept_event(make_event(1, scheduled="2029-12-31T18:00:00Z"), now=now)
+    assert ingest_filter.accept_event({"event_id": 1}, now=now)  # Partial updates are never rejected
+
+
+def test_filter_update_turns_rejected_markets_into_deletes():
+    ingest_filter = IngestFilter(market_types=["spread"], market_fields=["name"])
+    moneyline = {**make_event(1)["markets"][0], "event_id": 1}
+    payload = ingest_filter.filter_update({"change_type": "market", "op": "u", "info": moneyline})
+    assert payload["op"] == "d"
+
+    spread = {**make_event(1)["markets"][1], "event_id": 1, "extra": "dropped"}
+    payload = ingest_filter.filter_update({"change_type": "market", "op": "u", "info": spread})
+    assert payload["op"] == "u"
+    assert payload["info"]["event_id"] == 1 and "extra" not in payload["info"]
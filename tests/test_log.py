@@ -0,0 +1,83 @@
+import json
+import logging
+import queue
+
+import log
+from log import DroppingQueueHandler, JsonFormatter, RateLimitFilter
+
+
+def _record(msg, rate_key=None, args=None):
+    record = logging.LogRecord("odds", logging.INFO, __file__, 1, msg, args, None)
+    if rate_key is not None:
+        record.rate_key = rate_key
+    return record
+
+
+def test_rate_limit_suppresses_past_the_burst_and_reports_the_count(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(log.time, "monotonic", lambda: now[0])
+    rate_filter = RateLimitFilter(rate=2, burst=2)
+
+    passed = [rate_filter.filter(_record("odds changed", rate_key="odds")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+
+    # Keys have their own buckets, and records without a key always pass
+    assert rate_filter.filter(_record("seeded", rate_key="seed"))
+    assert all(rate_filter.filter(_record("no key")) for _ in range(10))
+
+    now[0] += 0.5  # One token refilled
+    record = _record("odds changed", rate_key="odds")
+    assert rate_filter.filter(record)
+    assert record.getMessage() == "odds changed (3 similar messages suppressed)"
+    assert not rate_filter.filter(_record("odds changed", rate_key="odds"))
+
+    now[0] += 10  # Refill is capped at the burst
+    assert [rate_filter.filter(_record("odds changed", rate_key="odds")) for _ in range(3)] == [True, True, False]
+
+
+def test_rate_limit_of_zero_disables_the_filter():
+    rate_filter = RateLimitFilter(rate=0)
+    assert all(rate_filter.filter(_record("odds changed", rate_key="odds")) for _ in range(100))
+
+
+def test_json_formatter_writes_one_object_per_record():
+    record = _record("placed %d orders", rate_key="orders", args=(3,))
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry == {
+        "time": entry["time"],
+        "level": "INFO",
+        "logger": "odds",
+        "thread": record.threadName,
+        "message": "placed 3 orders",
+        "rate_key": "orders",
+    }
+    assert "rate_key" not in json.loads(JsonFormatter().format(_record("no key")))
+
+
+def test_full_queue_drops_records_and_reports_them_on_the_next_one():
+    records = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(records)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    for n in range(5):
+        handler.handle(_record("order %d", args=(n,)))  # Never blocks or raises
+    assert handler.dropped == 3
+    assert [records.get_nowait().getMessage() for _ in range(2)] == ["order 0", "order 1"]
+
+    handler.handle(_record("order 5"))
+    assert records.get_nowait().getMessage() == "order 5 (3 records dropped, log queue full)"
+    handler.handle(_record("order 6"))
+    assert records.get_nowait().getMessage() == "order 6"
+    assert handler.dropped == 3
+    assert handler.take_dropped() == 0
+
+
+def test_dropped_records_unreported_at_shutdown_are_handed_over():
+    records = queue.Queue(maxsize=1)
+    handler = DroppingQueueHandler(records)
+    handler.handle(_record("order 0"))
+    handler.handle(_record("order 1"))
+    handler.handle(_record("order 2"))
+    assert handler.take_dropped() == 2
+    assert handler.take_dropped() == 0
+    assert handler.dropped == 2
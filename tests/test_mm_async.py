@@ -0,0 +1,206 @@
+import asyncio
+import base64
+import json
+
+import aiohttp
+import pytest
+
+import config
+from filters import IngestFilter
+from mm_async import AsyncMMInteractions
+from ratelimit import RequestBudget
+
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+
+    async def json(self, content_type=None):
+        if self._body is None:
+            raise json.JSONDecodeError("no body", "", 0)
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeMessage:
+    def __init__(self, data, type=aiohttp.WSMsgType.TEXT):
+        self.type = type
+        self.data = data
+
+
+class FakeWebSocket:
+    def __init__(self, frames):
+        self.frames = frames
+        self.sent = []
+
+    def __aiter__(self):
+        return self._messages()
+
+    async def _messages(self):
+        for frame in self.frames:
+            yield FakeMessage(frame if isinstance(frame, str) else json.dumps(frame))
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeSession:
+    """
+    Answers requests by config.URL route; routes maps a route to a callable
+    (method, kwargs) -> (status, body).
+    """
+
+    def __init__(self, routes: dict, frames: list = ()):
+        self.routes = routes
+        self.requests = []
+        self.websocket = FakeWebSocket(list(frames))
+        self._route_by_url = {config.BASE_URL.rstrip("/") + "/" + path: route for route, path in config.URL.items()}
+
+    def request(self, method, url, **kwargs):
+        route = self._route_by_url[url]
+        self.requests.append((route, kwargs))
+        status, body = self.routes[route](method, kwargs)
+        return FakeResponse(status, body)
+
+    def ws_connect(self, url, heartbeat=None):
+        self.ws_url = url
+        return self.websocket
+
+    async def close(self):
+        pass
+
+
+def _client(session, **kwargs) -> AsyncMMInteractions:
+    mm = AsyncMMInteractions(mm_keys={"access_key": "key", "secret_key": "secret"},
+                             tournaments=["Premier League"], ingest_filter=kwargs.pop("ingest_filter", IngestFilter()),
+                             budget=RequestBudget(rate=1000, burst=1000), **kwargs)
+    mm._http = session
+    mm.mm_session = {"access_token": "token", "refresh_token": "refresh"}
+    return mm
+
+
+def _ok(body):
+    return lambda method, kwargs: (200, body)
+
+
+def test_login_stores_the_session_and_rejects_bad_keys():
+    session = FakeSession({"mm_login": _ok({"data": {"access_token": "a", "refresh_token": "r"}})})
+    mm = _client(session)
+    assert asyncio.run(mm.mm_login()) == {"access_token": "a", "refresh_token": "r"}
+    route, kwargs = session.requests[0]
+    assert json.loads(kwargs["data"]) == {"access_key": "key", "secret_key": "secret"}
+    assert "headers" not in kwargs
+
+    session.routes["mm_login"] = lambda method, kwargs: (401, None)
+    with pytest.raises(Exception, match="login failed"):
+        asyncio.run(mm.mm_login())
+
+
+def test_seeding_keeps_wanted_tournaments_and_their_markets():
+    markets = {"11": [{"id": 1, "type": "moneyline", "status": "active", "selections": []}],
+               "12": [{"id": 2, "type": "spread", "status": "active", "selections": []}]}
+    session = FakeSession({
+        "mm_odds_ladder": _ok({"data": [100, 105, 110]}),
+        "mm_tournaments": _ok({"data": {"tournaments": [{"id": 1, "name": "Premier League"},
+                                                        {"id": 2, "name": "Serie A"}]}}),
+        "mm_events": _ok({"data": {"sport_events": [{"event_id": 11, "name": "A v B"},
+                                                    {"event_id": 12, "name": "C v D"},
+                                                    {"event_id": 13, "name": "no markets"}]}}),
+        "mm_multiple_markets": _ok({"data": markets}),
+    })
+    mm = _client(session, ingest_filter=IngestFilter(market_types=["moneyline"]))
+    asyncio.run(mm.seeding())
+
+    assert mm.valid_odds == [100, 105, 110]
+    assert list(mm.my_tournaments) == [1]
+    assert list(mm.sport_events) == [11]  # 12 only had a filtered market, 13 no markets at all
+    assert mm.sport_events[11]["tournament_name"] == "Premier League"
+    events_request = [kwargs for route, kwargs in session.requests if route == "mm_events"]
+    assert events_request == [{"params": {"tournament_id": 1}, "headers": {"Authorization": "Bearer token"}}]
+
+
+def test_batch_place_and_cancel_track_wagers():
+    def place(method, kwargs):
+        return 200, {"data": {"succeed_wagers": [{"external_id": wager["external_id"], "id": f"w-{index}"}
+                                                 for index, wager in enumerate(kwargs["json"]["data"])]}}
+
+    cancelled = []
+    session = FakeSession({
+        "mm_batch_place": place,
+        "mm_batch_cancel": lambda method, kwargs: (cancelled.append(kwargs["json"]["data"]) or 200, {}),
+    })
+    mm = _client(session)
+    succeed = asyncio.run(mm.place_wagers([{"line_id": "l1", "odds": 110, "stake": 1.0},
+                                           {"line_id": "l2", "odds": -120, "stake": 1.0}]))
+    assert [wager["id"] for wager in succeed] == ["w-0", "w-1"]
+    assert sorted(mm.wagers.values()) == ["w-0", "w-1"]
+
+    external_ids = list(mm.wagers)
+    assert asyncio.run(mm.cancel_wagers(external_ids))
+    assert mm.wagers == {}
+    assert sorted(wager["wager_id"] for wager in cancelled[0]) == ["w-0", "w-1"]
+
+    session.routes["mm_batch_place"] = lambda method, kwargs: (400, {"error": "bad odds"})
+    assert asyncio.run(mm.place_wagers([{"line_id": "l1", "odds": 1, "stake": 1.0}])) == []
+
+
+def _frame(channel, event, payload):
+    encoded = base64.b64encode(json.dumps(payload).encode()).decode()
+    return {"channel": channel, "event": event, "data": json.dumps({"payload": encoded})}
+
+
+def test_frames_are_dispatched_and_bad_frames_do_not_drop_the_websocket():
+    broadcast, private = "private-broadcast-service=1", "private-user-1"
+    session = FakeSession({
+        "websocket_config": _ok({"cluster": "eu", "key": "app"}),
+        "mm_auth": lambda method, kwargs: (200, {"auth": "signature"}) if "channel_name" in kwargs["data"] else
+        (200, {"data": {"authorized_channel": [
+            {"channel_name": broadcast},
+            {"channel_name": private, "binding_events": [{"name": "wager"}]},
+        ]}}),
+    }, frames=[
+        {"event": "pusher:connection_established", "data": json.dumps({"socket_id": "1.2"})},
+        {"event": "pusher:ping"},
+        _frame(broadcast, "tournament_1", {"n": 1}),
+        "not json",
+        {"channel": broadcast, "event": "tournament_1",
+         "data": json.dumps({"payload": base64.b64encode(b"{broken").decode()})},
+        _frame(broadcast, "tournament_1", {"raise": True}),
+        _frame(private, "wager", {"n": 2}),
+        _frame(broadcast, "tournament_1", {"n": 3}),
+    ])
+    mm = _client(session)
+    mm.my_tournaments = {1: {"name": "Premier League"}}
+    public, private_events = [], []
+
+    def public_handler(event_name, payload):
+        if payload.get("raise"):
+            raise ValueError("handler bug")
+        public.append(payload)
+
+    async def private_handler(event_name, payload):
+        private_events.append((event_name, payload))
+
+    asyncio.run(mm.subscribe(public_handler=public_handler, private_handler=private_handler))
+
+    assert public == [{"n": 1}, {"n": 3}]
+    assert private_events == [("wager", {"n": 2})]
+    assert session.ws_url.startswith("wss://ws-eu.pusher.com/app/app?")
+    sent = session.websocket.sent
+    assert {"event": "pusher:pong", "data": {}} in sent
+    assert [message["data"]["channel"] for message in sent if message["event"] == "pusher:subscribe"] == [broadcast, private]
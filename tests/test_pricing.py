@@ -0,0 +1,48 @@
+import numpy as np
+
+from conftest import make_event, make_selection
+import pricing
+
+LADDER = [100, 105, 110, 120, 150]
+
+
+def _book():
+    book = {event_id: make_event(event_id) for event_id in (1, 2, 3)}
+    book[3]["markets"][0]["status"] = "suspended"
+    # Current odds of any type must not matter to candidate selection
+    book[2]["markets"][0]["selections"] = [[make_selection("2-ml-home", odds="+150")],
+                                           [make_selection("2-ml-away", odds=None)], []]
+    return book
+
+
+def test_candidates_are_open_moneyline_selections():
+    candidates = pricing.moneyline_candidates(_book())
+    assert list(candidates["line_ids"]) == ["1-ml-home", "1-ml-away", "2-ml-home", "2-ml-away"]
+    assert list(candidates["market_index"]) == [0, 0, 1, 1]
+    assert candidates["n_markets"] == 2
+
+
+def test_plan_picks_whole_markets_and_prices_from_the_ladder():
+    candidates = pricing.moneyline_candidates(_book())
+    plan = pricing.plan_wagers(candidates, LADDER, rng=np.random.default_rng(7),
+                               market_probability=1, selection_probability=1, stake=2, copies=3)
+    assert len(plan["line_ids"]) == len(plan["odds"]) == len(plan["labels"]) == 12
+    assert list(plan["line_ids"][:3]) == ["1-ml-home"] * 3
+    assert set(np.abs(plan["odds"])) <= set(LADDER)
+    assert -100 not in plan["odds"]
+    assert plan["stake"] == 2.0
+
+
+def test_plan_without_chosen_markets_is_empty():
+    candidates = pricing.moneyline_candidates(_book())
+    plan = pricing.plan_wagers(candidates, LADDER, rng=np.random.default_rng(7), market_probability=0)
+    assert len(plan["line_ids"]) == 0
+
+
+def test_batch_payloads():
+    plan = {"line_ids": np.asarray(["a", "b", "c"], dtype=object), "odds": np.asarray([100, -110, 120]),
+            "labels": np.asarray(["", "", ""], dtype=object), "stake": 1.0}
+    batches = pricing.batch_payloads(plan, ["x1", "x2", "x3"], batch_size=2)
+    assert [len(batch["data"]) for batch in batches] == [2, 1]
+    assert batches[0]["data"][1] == {"external_id": "x2", "line_id": "b", "odds": -110, "stake": 1.0}
+    assert type(batches[0]["data"][1]["odds"]) is int
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from conftest import FakeInstance
+from fanout import FanOut
+import profiling
+
+
+@pytest.fixture
+def profile_modes():
+    yield profiling.configure
+    profiling.configure("")
+
+
+def _reports(stage):
+    if not os.path.isdir(profiling.PROFILE_DIR):
+        return []
+    return [name for name in os.listdir(profiling.PROFILE_DIR) if name.startswith(f"{stage}-")]
+
+
+def _handler(stage):
+    # Redefined on every call, like the websocket handlers on each subscribe()
+    @profiling.profiled(stage, aggregate=True)
+    def handle(frame):
+        return frame * 2
+
+    return handle
+
+
+def test_redefined_handlers_share_one_aggregate(profile_modes):
+    profile_modes("cpu")
+    assert _handler("test_shared")(1) == 2
+    assert _handler("test_shared")(2) == 4
+    assert profiling._aggregates["test_shared"].calls == 2
+
+
+def test_mem_only_aggregate_does_not_run_cprofile(profile_modes):
+    profile_modes("mem")
+    _handler("test_mem_only")(1)
+    aggregate = profiling._aggregates["test_mem_only"]
+    assert aggregate.calls == 1
+    assert aggregate.profiler.getstats() == []
+    aggregate.report()
+    assert [name for name in _reports("test_mem_only") if name.endswith(".mem.txt")]
+    assert not [name for name in _reports("test_mem_only") if name.endswith(".prof")]
+
+
+def test_export_profiles_the_flattener(profile_modes, book):
+    profile_modes("cpu")
+
+    class NullSink:
+        def open(self, header=None):
+            pass
+
+        def write_rows(self, rows, tournament):
+            pass
+
+        def close(self):
+            pass
+
+    assert FanOut([NullSink()]).run(FakeInstance(book)) == {}
+    report = [name for name in _reports("export_flatten") if name.endswith(".cpu.txt")]
+    assert report
+    with open(os.path.join(profiling.PROFILE_DIR, report[0])) as fp:
+        assert "event_rows" in fp.read()
+
+
+def test_disabled_profiling_is_a_pass_through():
+    assert not profiling.PROFILE_MODES
+    assert _handler("test_disabled")(3) == 6
+    assert "test_disabled" not in profiling._aggregates
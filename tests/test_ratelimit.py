@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import ratelimit
+from ratelimit import PRIORITY_CANCEL, PRIORITY_PLACE, PRIORITY_SEED, RequestBudget
+from supervisor import Supervisor
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_queued_callers_are_served_by_priority():
+    budget = RequestBudget(rate=20, burst=1)
+    assert budget.acquire(PRIORITY_SEED)  # Empty the bucket so everyone queues
+
+    served = []
+    threads = []
+    for priority in (PRIORITY_SEED, PRIORITY_PLACE, PRIORITY_CANCEL):
+        thread = threading.Thread(target=lambda p=priority: budget.acquire(p) and served.append(p))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda n=len(threads): budget.stats()["waiting"] == n)
+    for thread in threads:
+        thread.join()
+
+    assert served == [PRIORITY_CANCEL, PRIORITY_PLACE, PRIORITY_SEED]
+    assert budget.stats()["spent"] == {"cancel": 1, "place": 1, "seed": 2}
+
+
+def test_try_acquire_yields_to_queued_higher_priority():
+    budget = RequestBudget(rate=20, burst=1)
+    budget.acquire(PRIORITY_SEED)
+    thread = threading.Thread(target=budget.acquire, args=(PRIORITY_CANCEL,))
+    thread.start()
+    _wait_for(lambda: budget.stats()["waiting"] == 1)
+    assert budget.try_acquire(PRIORITY_SEED) > 0
+    thread.join()
+
+
+def test_acquire_times_out():
+    budget = RequestBudget(rate=1, burst=1)
+    budget.acquire(PRIORITY_SEED)
+    assert not budget.acquire(PRIORITY_SEED, timeout=0.01)
+    assert budget.stats()["waiting"] == 0
+
+
+def test_429_halves_the_rate_and_successes_raise_it_back():
+    budget = RequestBudget(rate=8, min_rate=1, max_rate=10, increase=0.5)
+    budget.record(429)
+    assert budget.rate == 4
+    assert budget.try_acquire(PRIORITY_CANCEL) > 0  # Bucket emptied
+    for _ in range(3):
+        budget.record(429)
+    assert budget.rate == 1  # Floored at min_rate
+    assert budget.stats()["throttled"] == 4
+
+    budget.record(500)
+    assert budget.rate == 1
+    for _ in range(100):
+        budget.record(200)
+    assert budget.rate == 10  # Capped at max_rate
+
+
+def test_budget_share_splits_the_rates():
+    budget = ratelimit.budget_share(4)
+    assert budget.rate == ratelimit.MM_RATE_LIMIT / 4
+    assert budget.max_rate == ratelimit.MM_RATE_LIMIT_MAX / 4
+    assert budget.min_rate == ratelimit.MM_RATE_LIMIT_MIN / 4
+    assert ratelimit.budget_share(0).rate == ratelimit.MM_RATE_LIMIT
+
+
+class _FakeProcess:
+    started = []
+
+    def __init__(self, target, args, name, daemon):
+        self.args = args
+
+    def start(self):
+        self.started.append(self.args)
+
+
+class _FakeContext:
+    Process = _FakeProcess
+
+
+def test_shards_on_the_same_account_share_its_rate():
+    accounts = [{"access_key": "a", "secret_key": "x"}, {"access_key": "b", "secret_key": "y"}]
+    supervisor = Supervisor(n_workers=3, accounts=accounts, tournaments=["t1", "t2", "t3"])
+    supervisor._ctx = _FakeContext()
+    _FakeProcess.started = []
+    supervisor.start()
+    # Shards 0 and 2 run on account a, shard 1 alone on account b
+    assert [(args[1]["access_key"], args[-1]) for args in _FakeProcess.started] == [("a", 2), ("b", 1), ("a", 2)]
+
+
+def test_async_callers_are_served_by_priority():
+    async def run():
+        budget = RequestBudget(rate=200, burst=1)
+        await budget.acquire_async(PRIORITY_SEED)  # Empty the bucket so everyone queues
+        served = []
+
+        async def acquire(priority, index):
+            await budget.acquire_async(priority)
+            served.append((priority, index))
+
+        tasks = [asyncio.create_task(acquire(PRIORITY_SEED, index)) for index in range(30)]
+        await asyncio.sleep(0)  # Let the seeding tasks queue first
+        tasks.append(asyncio.create_task(acquire(PRIORITY_CANCEL, 0)))
+        await asyncio.gather(*tasks)
+        return served
+
+    served = asyncio.run(run())
+    assert served[0] == (PRIORITY_CANCEL, 0)
+    assert served[1:] == [(PRIORITY_SEED, index) for index in range(30)]
+
+
+def test_threads_and_tasks_share_one_queue():
+    budget = RequestBudget(rate=20, burst=1)
+    budget.acquire(PRIORITY_SEED)
+    served = []
+
+    async def seed_task():
+        await budget.acquire_async(PRIORITY_SEED)
+        served.append("task")
+
+    task_thread = threading.Thread(target=asyncio.run, args=(seed_task(),))
+    task_thread.start()
+    _wait_for(lambda: budget.stats()["waiting"] == 1)
+    cancel_thread = threading.Thread(target=lambda: budget.acquire(PRIORITY_CANCEL) and served.append("thread"))
+    cancel_thread.start()
+    for thread in (task_thread, cancel_thread):
+        thread.join()
+    assert served == ["thread", "task"]
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    async def run():
+        budget = RequestBudget(rate=1, burst=1)
+        await budget.acquire_async(PRIORITY_SEED)
+        waiter = asyncio.create_task(budget.acquire_async(PRIORITY_SEED))
+        await asyncio.sleep(0.01)
+        assert budget.stats()["waiting"] == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return budget.stats()["waiting"]
+
+    assert asyncio.run(run()) == 0
+
+
+def test_route_priority():
+    assert ratelimit.route_priority("mm_cancel_wager") == PRIORITY_CANCEL
+    assert ratelimit.route_priority("mm_batch_place") == PRIORITY_PLACE
+    assert ratelimit.route_priority("mm_events") == PRIORITY_SEED
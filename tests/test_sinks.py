@@ -0,0 +1,71 @@
+import glob
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import FakeInstance, make_event
+from fanout import FanOut
+import sheets
+import sinks
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+SNAPSHOT_AT = datetime(2030, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def _book():
+    book = {event_id: make_event(event_id) for event_id in (1, 2, 3)}
+    book[3]["tournament_name"] = "Serie A"
+    # A selection without a stake yet is flattened to ""
+    book[1]["markets"][0]["selections"][0][0]["stake"] = ""
+    return book
+
+
+def _export(root, **kwargs):
+    sink = sinks.ParquetSink(root=str(root), snapshot_at=SNAPSHOT_AT, **kwargs)
+    assert FanOut([sink], batch_rows=1).run(FakeInstance(_book())) == {}
+    return sink
+
+
+def test_parquet_partitions_and_typed_columns(tmp_path):
+    sink = _export(tmp_path, row_group_size=3)
+
+    premier = glob.glob(str(tmp_path / "date=2030-01-01" / "tournament=Premier_League" / "snapshot-*.parquet"))
+    serie_a = glob.glob(str(tmp_path / "date=2030-01-01" / "tournament=Serie_A" / "snapshot-*.parquet"))
+    assert len(premier) == 1 and len(serie_a) == 1
+    assert sorted(sink.paths) == sorted(premier + serie_a)
+
+    table = pq.read_table(premier[0])
+    assert table.num_rows == 8
+    assert table.column_names == sheets.HEADER + [sinks.SNAPSHOT_COLUMN]
+    for column in sinks.NUMERIC_COLUMNS:
+        assert str(table.schema.field(column).type) == "double"
+    assert str(table.schema.field("Event Name").type) == "string"
+
+    rows = table.to_pylist()
+    stakes = {row["Selection ID"]: row["Selection Stake"] for row in rows}
+    assert stakes["1-ml-home"] is None  # "" becomes null
+    assert stakes["1-ml-away"] == 10.0
+    assert rows[0]["Selection Odds"] == 100.0
+    assert all(row[sinks.SNAPSHOT_COLUMN] == SNAPSHOT_AT for row in rows)
+
+
+def test_parquet_row_groups_split_at_row_group_size(tmp_path):
+    _export(tmp_path, row_group_size=3)
+    [premier] = glob.glob(str(tmp_path / "*" / "tournament=Premier_League" / "*.parquet"))
+    metadata = pq.ParquetFile(premier).metadata
+    assert [metadata.row_group(index).num_rows for index in range(metadata.num_row_groups)] == [3, 3, 2]
+
+
+def test_second_run_adds_a_snapshot_without_rewriting_the_first(tmp_path):
+    first = _export(tmp_path)
+    first_path = next(path for path in first.paths if "Premier_League" in path)
+    first_mtime = os.stat(first_path).st_mtime_ns
+
+    second = _export(tmp_path)
+    snapshots = glob.glob(str(tmp_path / "*" / "tournament=Premier_League" / "*.parquet"))
+    assert len(snapshots) == 2
+    assert first.run_id != second.run_id
+    assert os.stat(first_path).st_mtime_ns == first_mtime
+    assert pq.read_table(first_path).num_rows == 8
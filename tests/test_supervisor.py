@@ -0,0 +1,168 @@
+import queue
+import threading
+
+import pytest
+
+from book import VersionedBook
+from changefeed import OddsChangeFeed
+from conftest import make_event
+import supervisor
+from supervisor import Supervisor, shard_tournaments
+
+
+class FakeClient:
+    """
+    Stands in for MMInteractions in a shard: seeding fills a VersionedBook.
+    """
+    instances = []
+
+    def __init__(self, mm_keys=None, tournaments=None, budget=None):
+        self.my_tournaments = {1: {"name": "Premier League"}}
+        self.book = VersionedBook()
+        self.calls = []
+        self.instances.append(self)
+
+    @property
+    def sport_events(self):
+        return self.book.snapshot()
+
+    def mm_login(self):
+        self.calls.append("mm_login")
+
+    def seeding(self):
+        self.book.put_many({event_id: make_event(event_id) for event_id in (1, 2, 3)})
+
+    def subscribe(self):
+        self.calls.append("subscribe")
+
+    def schedule_session_refresh(self):
+        self.calls.append("schedule_session_refresh")
+
+    def keep_alive(self):
+        self.calls.append("keep_alive")
+
+    def auto_playing(self):
+        self.calls.append("auto_playing")
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    import mm_calls
+
+    FakeClient.instances = []
+    monkeypatch.setattr(mm_calls, "MMInteractions", FakeClient)
+    return FakeClient
+
+
+def test_shard_tournaments():
+    assert shard_tournaments(["a", "b", "c", "d", "e"], 2) == [["a", "c", "e"], ["b", "d"]]
+    assert shard_tournaments(["a"], 4) == [["a"]]
+
+
+@pytest.mark.parametrize("trade, expected", [
+    (False, ["mm_login", "subscribe", "schedule_session_refresh", "keep_alive"]),
+    (True, ["mm_login", "subscribe", "auto_playing"]),
+])
+def test_live_shard_refreshes_its_session_and_publishes_only_changes(fake_client, trade, expected):
+    results, stop_event = queue.Queue(), threading.Event()
+    worker = threading.Thread(target=supervisor._run_shard,
+                              args=(0, {}, ["Premier League"], results, stop_event, True, trade, 0.01))
+    worker.start()
+    try:
+        _, my_tournaments, seeded, removed = results.get(timeout=5)
+        assert sorted(seeded) == [1, 2, 3] and removed == []
+        client = fake_client.instances[0]
+        assert client.calls == expected
+
+        client.book.apply_update({"change_type": "selection", "info": {"line_id": "2-ml-home", "odds": 150}})
+        client.book.apply_update({"change_type": "sport_event", "op": "d", "info": {"event_id": 3}})
+        _, _, changed, removed = results.get(timeout=5)
+        assert list(changed) == [2] and removed == [3]
+        with pytest.raises(queue.Empty):
+            results.get(timeout=0.05)  # Nothing changed since
+    finally:
+        stop_event.set()
+        worker.join()
+
+
+def test_poll_merges_changes_into_the_shard_book():
+    change_feed = OddsChangeFeed(auto_flush=False)
+    merger = Supervisor(n_workers=2, accounts=[{"access_key": "a"}], tournaments=["t1", "t2"],
+                        change_feed=change_feed)
+    merger._results = queue.Queue()
+    merger._results.put((0, {1: {"name": "t1"}}, {1: make_event(1), 2: make_event(2)}, []))
+    merger._results.put((1, {2: {"name": "t2"}}, {3: make_event(3)}, []))
+    assert merger.poll(timeout=1) == 2
+    assert sorted(merger.sport_events) == [1, 2, 3]
+    assert change_feed.last_value("2-ml-home") is not None
+
+    updated = make_event(1, status="live")
+    merger._results.put((0, {1: {"name": "t1"}}, {1: updated}, [2]))
+    merger._results.put((1, None, RuntimeError("login failed"), None))
+    assert merger.poll(timeout=1) == 2
+    assert sorted(merger.sport_events) == [1, 3]
+    assert merger.sport_events[1]["status"] == "live"
+    assert change_feed.last_value("2-ml-home") is None
+    assert merger._failed == {1}
+
+
+class _ExitedProcess:
+    def __init__(self, exitcode):
+        self.exitcode = exitcode
+
+
+def test_shard_killed_before_publishing_is_marked_failed():
+    merger = Supervisor(n_workers=2, accounts=[{"access_key": "a"}], tournaments=["t1", "t2"])
+    merger._results = queue.Queue()
+    merger._processes = [_ExitedProcess(-9), _ExitedProcess(None)]  # Shard 0 killed by SIGKILL
+    merger._results.put((1, {2: {"name": "t2"}}, {3: make_event(3)}, []))
+
+    merger.wait_seeded(timeout=5, check_interval=0.01)
+    assert merger._failed == {0}
+    assert sorted(merger.sport_events) == [3]
+
+
+def test_shard_that_published_then_exited_is_not_failed():
+    merger = Supervisor(n_workers=1, accounts=[{"access_key": "a"}], tournaments=["t1"])
+    merger._results = queue.Queue()
+    merger._processes = [_ExitedProcess(0)]
+    merger._results.put((0, {1: {"name": "t1"}}, {1: make_event(1)}, []))
+    merger.wait_seeded(timeout=5, check_interval=0.01)
+    assert merger._failed == set()
+    assert sorted(merger.sport_events) == [1]
+
+
+def test_shard_import_error_is_reported(monkeypatch):
+    import sys
+
+    monkeypatch.setitem(sys.modules, "mm_calls", None)  # import mm_calls raises ImportError
+    results = queue.Queue()
+    supervisor._run_shard(0, {}, ["t1"], results, threading.Event(), False, False, 1)
+    shard_index, my_tournaments, error, _ = results.get_nowait()
+    assert (shard_index, my_tournaments) == (0, None)
+    assert isinstance(error, ImportError)
+
+
+def test_watch_stops_the_workers_on_any_error(monkeypatch):
+    import main
+    import watch
+
+    class FakeSupervisor:
+        stopped = False
+
+        def stop(self):
+            self.stopped = True
+
+    class BrokenWatcher:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def run_forever(self, wait=None):
+            raise RuntimeError("sheets unavailable")
+
+    fake = FakeSupervisor()
+    monkeypatch.setattr(main, "_seeded_supervisor", lambda *args, **kwargs: fake)
+    monkeypatch.setattr(watch, "SheetWatcher", BrokenWatcher)
+    with pytest.raises(RuntimeError):
+        main.main(["watch", "--workers", "2", "--sheet-name", "Odds"])
+    assert fake.stopped
@@ -0,0 +1,191 @@
+import re
+
+import pytest
+
+from changefeed import OddsChangeFeed
+from conftest import FakeInstance, make_event
+import sheets
+from watch import SheetWatcher
+
+
+class _Request:
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self):
+        return self.run()
+
+
+class FakeValues:
+    """
+    In-memory sheet behind spreadsheets().values(), rows keyed by 1-based number.
+    """
+
+    def __init__(self):
+        self.rows = dict()
+        self.calls = []
+        self.fail = None
+
+    def _call(self, name, run):
+        def execute():
+            self.calls.append(name)
+            if self.fail is not None:
+                raise self.fail
+            return run()
+        return _Request(execute)
+
+    def _write(self, cell_range, values):
+        first = int(re.search(r"!A(\d+)$", cell_range).group(1))
+        for offset, row in enumerate(values):
+            self.rows[first + offset] = row
+
+    def clear(self, spreadsheetId, range):
+        return self._call("clear", self.rows.clear)
+
+    def update(self, spreadsheetId, range, body, valueInputOption):
+        return self._call("update", lambda: self._write(range, body["values"]))
+
+    def batchUpdate(self, spreadsheetId, body):
+        return self._call("batchUpdate", lambda: [self._write(data["range"], data["values"])
+                                                  for data in body["data"]])
+
+    def append(self, spreadsheetId, range, body, valueInputOption):
+        # Like the API: after the first contiguous block of non-empty rows
+        def run():
+            row = 1
+            while any(self.rows.get(row) or []):
+                row += 1
+            self._write(f"!A{row}", body["values"])
+        return self._call("append", run)
+
+    def live_rows(self) -> dict:
+        return {row[sheets.LINE_ID_COLUMN]: (number, row) for number, row in self.rows.items() if number > 1 and any(row)}
+
+
+class FakeService:
+    def __init__(self, values):
+        self._values = values
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self._values
+
+
+@pytest.fixture
+def sheet(monkeypatch):
+    values = FakeValues()
+    monkeypatch.setattr(sheets, "get_service", lambda: FakeService(values))
+    return values
+
+
+def _watcher(book):
+    instance = FakeInstance(book)
+    instance.change_feed = OddsChangeFeed(coalesce_window=0, auto_flush=False)
+    instance.change_feed.observe_book(book)
+    return instance, SheetWatcher(instance, "Odds", max_calls_per_minute=100)
+
+
+def _observe(instance, event_id):
+    instance.change_feed.observe_event(event_id, instance.sport_events.get(event_id))
+
+
+def _assert_rows_match_book(sheet, instance):
+    expected = {row[sheets.LINE_ID_COLUMN]: row for event_id, event in instance.sport_events.items()
+                for row in sheets.event_rows(event_id, event)}
+    live = sheet.live_rows()
+    assert {line_id: row for line_id, (_, row) in live.items()} == expected
+
+
+def test_removal_then_new_rows_keep_every_row_in_place(sheet):
+    book = {event_id: make_event(event_id) for event_id in (1, 2)}
+    instance, watcher = _watcher(book)
+    watcher.write_full()
+    assert len(sheet.rows) == 9
+
+    book[1] = {**book[1], "markets": book[1]["markets"][1:]}  # Moneyline of event 1 leaves the book
+    _observe(instance, 1)
+    book[3] = make_event(3)
+    _observe(instance, 3)
+    watcher.flush()
+
+    assert sheet.calls[-1] == "batchUpdate"
+    assert not any(sheet.rows[2]) and not any(sheet.rows[3])  # Blanked, not reused
+    _assert_rows_match_book(sheet, instance)
+    assert sheet.live_rows()["3-ml-home"][0] == 10
+    assert watcher._row_by_line_id["3-ml-home"] == 10
+
+    # Later updates to the new lines land on their own rows
+    selection = book[3]["markets"][0]["selections"][0][0]
+    book[3] = make_event(3)
+    book[3]["markets"][0]["selections"][0][0] = {**selection, "odds": 175}
+    _observe(instance, 3)
+    watcher.flush()
+    _assert_rows_match_book(sheet, instance)
+    assert sheet.rows[10][sheets.HEADER.index("Selection Odds")] == 175
+
+
+def test_failed_flush_keeps_rows_dirty(sheet):
+    from googleapiclient.errors import HttpError
+
+    book = {1: make_event(1)}
+    instance, watcher = _watcher(book)
+    watcher.write_full()
+    book[2] = make_event(2)
+    _observe(instance, 2)
+
+    sheet.fail = HttpError(type("Response", (), {"status": 503, "reason": "unavailable"})(), b"")
+    watcher.flush()
+    assert watcher._next_row == 6 and "2-ml-home" not in watcher._row_by_line_id
+
+    sheet.fail = None
+    watcher.flush()
+    _assert_rows_match_book(sheet, instance)
+
+
+def test_changes_during_the_full_write_are_kept(sheet):
+    book = {1: make_event(1)}
+    instance, watcher = _watcher(book)
+    update = sheet.update
+
+    def update_while_odds_move(**kwargs):
+        # A change reported while the snapshot is being written
+        book[1] = make_event(1)
+        book[1]["markets"][0]["selections"][0][0]["odds"] = 190
+        _observe(instance, 1)
+        return update(**kwargs)
+
+    sheet.update = update_while_odds_move
+    assert watcher.write_full()
+    assert watcher._dirty == {"1-ml-home": 1}
+    watcher.flush()
+    _assert_rows_match_book(sheet, instance)
+
+
+def test_failed_full_write_is_retried(sheet):
+    from googleapiclient.errors import HttpError
+
+    instance, watcher = _watcher({1: make_event(1)})
+    sheet.fail = HttpError(type("Response", (), {"status": 503, "reason": "unavailable"})(), b"")
+    assert not watcher.write_full()
+
+    attempts = []
+
+    def wait():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            sheet.fail = None
+        else:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        watcher.run_forever(wait=wait)
+    _assert_rows_match_book(sheet, instance)
+
+
+def test_full_write_within_the_call_budget(sheet):
+    instance, watcher = _watcher({1: make_event(1)})
+    watcher.max_calls_per_minute = 1
+    assert not watcher.write_full()
+    assert sheet.calls == []